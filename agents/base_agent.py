@@ -1,61 +1,225 @@
+import json
 import logging
+from functools import lru_cache
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 import litellm
 from litellm import completion
+from agents.llm_cache import LLMCache
+from agents.rate_limit import get_limiter
+from agents.streaming import StreamAborted, StreamMonitor
+from agents.telemetry import Tracer
 
 logger = logging.getLogger('gl2gh')
 
 class BaseAgent:
     prompt_file: str = "changeme.md"
+    # an optional system prompt, for the parts of the prompt which don't change between calls
+    system_prompt_file: str | None = None
+    # how many times a streamed response can be abandoned and restarted before we take whatever we get
+    stream_retries: int = 1
 
-    def __init__(self, model_name: str = "o4-mini", provider: str = "openai"):
+    def __init__(self, model_name: str = "o4-mini", provider: str = "openai", cache: LLMCache | None = None,
+                 tracer: Tracer | None = None, stream: bool = False):
         self.model_name = model_name
         self.provider = provider
-        self.env = Environment(
-            loader=FileSystemLoader("prompts"),
-            autoescape=select_autoescape()
-        )
+        self.cache = cache
+        self.tracer = tracer or Tracer()
+        self.stream = stream
+        # shared by every agent using the same provider, so they all keep within its limits together
+        self.limiter = get_limiter(provider)
+        self.env = get_environment()
         logger.debug(f"Initialized {self.__class__.__name__} with model={self.model_name}, provider={self.provider}")
 
     def get_prompt(self, **kwargs) -> str:
-        template = self.env.get_template(self.prompt_file)
+        return self.render(self.prompt_file, **kwargs)
+
+    def get_system_prompt(self, **kwargs) -> str | None:
+        if not self.system_prompt_file:
+            return None
+        return self.render(self.system_prompt_file, **kwargs)
+
+    def render(self, prompt_file: str, **kwargs) -> str:
+        template = self.env.get_template(prompt_file)
         rendered = template.render(**kwargs)
-        logger.debug(f"Rendered prompt from {self.prompt_file}:\n{rendered}")  # log only first 500 chars
+        logger.debug(f"Rendered prompt from {prompt_file}:\n{rendered}")  # log only first 500 chars
         return rendered
 
+    def get_messages(self, **kwargs) -> list[dict]:
+        """
+        The messages to send - the prompt as a single user message, or if the agent has a `system_prompt_file`, that
+        as a system message first.  The system prompt holds everything that stays the same from one attempt to the
+        next, so the provider can cache it rather than processing (and billing) it in full every time.
+        """
+        messages = []
+        system_prompt = self.get_system_prompt(**kwargs)
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": self.get_prompt(**kwargs)})
+        return messages
+
     def get_full_model_name(self) -> str:
         return f"{self.provider}/{self.model_name}"
 
-    def run(self, **kwargs) -> tuple[str, float]:
-        prompt = self.get_prompt(**kwargs)
+    def run(self, variant: int = 0, stream_to: str | None = None, **kwargs) -> tuple[str, float]:
+        messages = self.get_messages(**kwargs)
         logger.debug(f"Running agent with provider={self.provider}")
-        logger.debug(f"Prompt:\n{prompt}")
 
         full_model_name = self.get_full_model_name()
         logger.debug(f"Using model: {full_model_name}")
 
-        response, cost = self.get_llm_response(prompt)
+        response, cost = self.get_llm_response(messages, variant=variant, stream_to=stream_to)
 
         logger.debug(f"LLM response (first 200 chars): {response[:200]}")
         logger.debug(f"Cost for response: US${cost}")
         return response, cost
 
-    def get_llm_response(self, prompt: str) -> tuple[str, float]:
+    def get_stage(self) -> str:
+        """The name used for this agent's calls in the run report - the prompt file without its extension"""
+        return self.prompt_file.rsplit(".", 1)[0]
+
+    def get_llm_response(self, messages: list[dict], variant: int = 0, stream_to: str | None = None) -> tuple[str, float]:
         logger.debug("Calling LLM API")
         full_model_name = self.get_full_model_name()
         logger.debug(f"Using model: {full_model_name}")
-        litellm.drop_params = True
+        with self.tracer.span("llm", stage=self.get_stage(), model=full_model_name, variant=variant) as span:
+            if self.cache:
+                # a lone user message is keyed on its text alone, as it always has been
+                cache_text = messages[0]["content"] if len(messages) == 1 else json.dumps(messages)
+                cache_key = self.cache.make_key(self.provider, self.model_name, cache_text, variant)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    logger.debug("Using cached LLM response")
+                    span.set(cache_hit=True, cost=0.0)
+                    return cached, 0.0
+            litellm.drop_params = True
+            messages = self.mark_cache_breakpoints(messages, full_model_name)
+            if self.stream:
+                content, cost, usage, aborts = self.get_streamed_response(full_model_name, messages, stream_to)
+                span.set(stream_aborts=aborts)
+            else:
+                try:
+                    response = self.limiter.call(
+                        lambda: completion(model=full_model_name, messages=messages),
+                        tokens=estimate_tokens(messages),
+                    )
+                except Exception as e:
+                    logger.error(f"Error calling LLM API: {e}")
+                    raise e
+                cost = response._hidden_params.get("response_cost", 0.0)
+                content = response.choices[0].message.content
+                usage = get_usage(getattr(response, "usage", None))
+            if not cost:
+                # sometimes litellm returns None for cost - so we catch that
+                cost = 0.0
+            logger.debug(f"LLM cost: US${cost}, tokens: {usage}")
+            span.set(cache_hit=False, cost=cost, **usage)
+            if self.cache and content:
+                self.cache.set(cache_key, content, cost)
+            return content, cost
+
+    def mark_cache_breakpoints(self, messages: list[dict], full_model_name: str) -> list[dict]:
+        """
+        Mark the end of the system prompt as a cache breakpoint for providers which need to be told what to cache
+        (eg, Anthropic).  Others (eg, OpenAI) cache long prompt prefixes automatically and get the messages unchanged.
+        """
+        if messages[0]["role"] != "system":
+            return messages
         try:
-            response = completion(
-                model=full_model_name,
-                messages=[{"role": "user", "content": prompt}],
-            )
+            supported = litellm.supports_prompt_caching(model=full_model_name)
+        except Exception:
+            supported = False
+        if not supported:
+            return messages
+        system = {
+            "role": "system",
+            "content": [{"type": "text", "text": messages[0]["content"], "cache_control": {"type": "ephemeral"}}],
+        }
+        return [system] + messages[1:]
+
+    def get_streamed_response(self, full_model_name: str, messages: list[dict], stream_to: str | None = None) -> tuple[str, float, dict, int]:
+        """
+        Stream the response, watching it as it arrives (and writing it to `stream_to` if given) so that hopeless output
+        can be abandoned and restarted early.  The last try is always read to the end.
+        Returns the content, the cost and token usage of every try, and how many tries were abandoned.
+        """
+        total_cost = 0.0
+        total_usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        for retry in range(self.stream_retries + 1):
+            monitor = StreamMonitor(stream_to, abort=retry < self.stream_retries)
+            chunks = []
+            try:
+                response = self.limiter.call(
+                    lambda: completion(model=full_model_name, messages=messages, stream=True,
+                                       stream_options={"include_usage": True}),
+                    tokens=estimate_tokens(messages),
+                )
+            except Exception as e:
+                logger.error(f"Error calling LLM API: {e}")
+                raise e
+            try:
+                for chunk in response:
+                    chunks.append(chunk)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta and monitor.feed(delta):
+                        # the workflow is complete - don't wait for any commentary after it
+                        break
+                content = monitor.result()
+            except StreamAborted as e:
+                logger.info(f"Abandoning streamed response ({e.reason}) - retrying")
+                content = None
+            finally:
+                close = getattr(response, "close", None)
+                if close:
+                    close()
+
+            cost, usage = self.get_stream_usage(chunks, messages, monitor.text)
+            total_cost += cost
+            for key in total_usage:
+                total_usage[key] += usage[key]
+            if content is not None:
+                return content, total_cost, total_usage, retry
+
+    def get_stream_usage(self, chunks: list, messages: list[dict], text: str) -> tuple[float, dict]:
+        """The cost and token usage of a (possibly abandoned) streamed response"""
+        try:
+            response = litellm.stream_chunk_builder(chunks, messages=messages)
+            cost = litellm.completion_cost(completion_response=response) or 0.0
+            return cost, get_usage(response.usage)
         except Exception as e:
-            logger.error(f"Error calling LLM API: {e}")
-            raise e
-        cost = response._hidden_params.get("response_cost", 0.0)
-        if not cost:
-            # sometimes litellm returns None for cost - so we catch that
-            cost = 0.0
-        logger.debug(f"LLM cost: US${cost}")
-        return response.choices[0].message.content, cost
+            logger.debug(f"Could not work out the usage of a streamed response: {e}")
+            return 0.0, {"prompt_tokens": estimate_tokens(messages), "completion_tokens": (len(text) + 3) // 4, "cached_tokens": 0}
+
+@lru_cache(maxsize=None)
+def get_environment(prompts_dir: str = "prompts") -> Environment:
+    """
+    The Jinja environment for the prompts - one per process, shared by every agent, so each template is only parsed
+    and compiled once however many agents (and conversions) use it.  Edited templates are still picked up.
+    """
+    return Environment(
+        loader=FileSystemLoader(prompts_dir),
+        autoescape=select_autoescape()
+    )
+
+def get_usage(usage) -> dict:
+    """The prompt, completion and cached prompt tokens from a litellm usage object"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details else None
+    if cached is None:
+        # Anthropic reports the tokens read from its cache separately
+        cached = getattr(usage, "cache_read_input_tokens", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": cached or 0,
+    }
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """A rough count of the prompt tokens in some messages - about four characters to a token"""
+    prompt = "\n".join(message_text(message) for message in messages)
+    return (len(prompt) + 3) // 4
+
+def message_text(message: dict) -> str:
+    content = message["content"]
+    if isinstance(content, list):
+        return "\n".join(block.get("text", "") for block in content)
+    return content
@@ -0,0 +1,57 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger('gl2gh')
+
+STATE_SUFFIX = "_state.json"
+
+class CheckpointError(Exception):
+    """A saved run can't be resumed"""
+
+class Checkpoint:
+    """
+    The saved progress of a conversion run, written next to its output files (`<output basename>_state.json`) after
+    each stage - the plan, then every attempt (implementation, validation errors, docs, guidance and quality check).
+
+    A run which dies part way through can be picked up from the last completed stage with `--resume`, rather than
+    paying for the plan and the earlier attempts again.  Each save replaces the file atomically, so an interrupted
+    write never leaves a half-written state behind.
+    """
+
+    version = 1
+
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    @classmethod
+    def for_run(cls, run: str) -> "Checkpoint":
+        """The checkpoint for a run, given either its state file or its output basename (eg `output_20250101_120000`)"""
+        if not run.endswith(STATE_SUFFIX):
+            run = f"{run}{STATE_SUFFIX}"
+        return cls(run)
+
+    def save(self, stage: str, gitlab_yaml: str, **state):
+        state = {"version": self.version, "stage": stage, "gitlab_yaml_hash": yaml_hash(gitlab_yaml), **state}
+        temp_filename = f"{self.filename}.tmp"
+        with open(temp_filename, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp_filename, self.filename)
+        logger.debug(f"Saved run state ({stage}) to {self.filename}")
+
+    def load(self, gitlab_yaml: str) -> dict:
+        try:
+            with open(self.filename, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CheckpointError(f"Could not read run state from {self.filename}: {e}")
+        if state.get("version") != self.version:
+            raise CheckpointError(f"{self.filename} was saved by an incompatible version")
+        if state.get("gitlab_yaml_hash") != yaml_hash(gitlab_yaml):
+            raise CheckpointError(f"{self.filename} is for a different GitLab pipeline")
+        logger.info(f"Resuming from {self.filename} (after {state['stage']})")
+        return state
+
+def yaml_hash(gitlab_yaml: str) -> str:
+    return hashlib.sha256(gitlab_yaml.encode("utf-8")).hexdigest()
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import logging
+import re
+import yaml
+from agents.validator import LintError
+from agents.yaml_utils import load_workflow
+
+logger = logging.getLogger('gl2gh')
+
+class AttemptHistory:
+    """
+    Fingerprints of each failed attempt's workflow and of its set of actionlint errors, so the converter can tell when
+    it has stopped making progress - the same workflow coming back again, or the same errors as last time - and the
+    error guidance worked out for each set of errors, so it isn't paid for twice.
+    """
+
+    def __init__(self):
+        self.implementations = []
+        self.error_sets = []
+        self.guidance = {}
+
+    def record(self, implementation: str, errors: list[LintError]) -> str | None:
+        """Record a failed attempt - returns why the conversion has stalled if it has, otherwise None"""
+        implementation_fingerprint = fingerprint_implementation(implementation)
+        errors_fingerprint = fingerprint_errors(errors)
+        stall = None
+        if implementation_fingerprint in self.implementations:
+            stall = "the same workflow was produced again"
+        elif self.error_sets and self.error_sets[-1] == errors_fingerprint:
+            stall = "the errors are the same as the previous attempt's"
+        self.implementations.append(implementation_fingerprint)
+        self.error_sets.append(errors_fingerprint)
+        return stall
+
+    def get_guidance(self, errors: list[LintError]) -> str | None:
+        """The guidance already worked out for this set of errors, if any"""
+        return self.guidance.get(fingerprint_errors(errors))
+
+    def set_guidance(self, errors: list[LintError], guidance: str):
+        self.guidance[fingerprint_errors(errors)] = guidance
+
+    def to_dict(self) -> dict:
+        return {"implementations": self.implementations, "error_sets": self.error_sets, "guidance": self.guidance}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "AttemptHistory":
+        history = cls()
+        history.implementations = state["implementations"]
+        history.error_sets = state["error_sets"]
+        history.guidance = state["guidance"]
+        return history
+
+def fingerprint_implementation(implementation: str) -> str:
+    """A hash of the workflow's content - comments, formatting and key order don't count"""
+    try:
+        normalised = json.dumps(load_workflow(implementation), sort_keys=True, default=str)
+    except (ValueError, yaml.YAMLError):
+        lines = [line.split(" #", 1)[0].strip() for line in implementation.splitlines()]
+        normalised = "\n".join(line for line in lines if line and not line.startswith("#"))
+    return hashlib.sha256(normalised.encode("utf-8")).hexdigest()
+
+def fingerprint_errors(errors: list[LintError]) -> str:
+    """A hash of the set of errors - ignoring where they are, which moves about as the workflow is edited"""
+    normalised = sorted({(error.kind, re.sub(r"\s+", " ", error.message).strip()) for error in errors})
+    return hashlib.sha256(json.dumps(normalised).encode("utf-8")).hexdigest()
@@ -2,3 +2,4 @@ from agents.base_agent import BaseAgent
 
 class DebugAgent(BaseAgent):
     prompt_file: str = "debugger.md"
+    system_prompt_file: str = "conversion_context.md"
@@ -0,0 +1,65 @@
+import logging
+from agents.base_agent import BaseAgent
+from agents.pipeline import GitLabPipeline
+from agents.yaml_utils import dump_yaml, load_workflow
+
+logger = logging.getLogger('gl2gh')
+
+class JobGroupAgent(BaseAgent):
+    """
+    Converts one group of jobs from a large pipeline, given the pipeline-wide settings and the ids of every job
+    (so `needs:` between groups line up when the results are merged).
+    """
+    prompt_file: str = "job_group.md"
+
+    def run_group(self, pipeline: GitLabPipeline, names: list[str]) -> tuple[str, float]:
+        return self.run(
+            global_context=pipeline.context_yaml(),
+            group_yaml=pipeline.jobs_yaml(names),
+            job_index=job_index(pipeline),
+        )
+
+def job_index(pipeline: GitLabPipeline) -> str:
+    """Every job's name and stage, and the GitHub job id it's converted to"""
+    job_ids = pipeline.job_ids()
+    return "\n".join(
+        f"- {name!r} (stage: {pipeline.job_stage(name)}) -> GitHub job id `{job_ids[name]}`" for name in pipeline.jobs
+    )
+
+def group_plan(pipeline: GitLabPipeline, groups: list[list[str]]) -> str:
+    """
+    A stand-in for the plan when a pipeline has been converted a group of jobs at a time - there's no plan of the whole
+    pipeline, so later fixes are told that, and how its jobs map to the workflow's
+    """
+    return "\n".join([
+        f"No plan was made for this pipeline as a whole - it is large, so its {len(pipeline.jobs)} jobs were converted in "
+        f"{len(groups)} groups and the results merged.  Keep every job, and the job ids below, when fixing the workflow.",
+        "",
+        job_index(pipeline),
+    ])
+
+def merge_workflows(workflows: list[str]) -> str:
+    """
+    Merge the workflows converted from each job group into one.  The top-level settings come from the first
+    workflow (with `env` merged from all of them) and the jobs from every workflow are combined.
+    """
+    merged = {}
+    for workflow in workflows:
+        data = load_workflow(workflow)
+        for key, value in data.items():
+            if key == "jobs":
+                jobs = merged.setdefault("jobs", {})
+                for job_name, job in (value or {}).items():
+                    if job_name in jobs:
+                        logger.warning(f"Job {job_name} was produced by more than one group - keeping the first")
+                        continue
+                    jobs[job_name] = job
+            elif key == "env" and isinstance(value, dict) and isinstance(merged.get("env"), dict):
+                merged["env"] = {**value, **merged["env"]}
+            else:
+                merged.setdefault(key, value)
+
+    # keep jobs last, the conventional place for them
+    if "jobs" in merged:
+        merged["jobs"] = merged.pop("jobs")
+    return dump_yaml(merged)
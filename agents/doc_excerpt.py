@@ -0,0 +1,162 @@
+import math
+import re
+from collections import Counter
+from urllib.parse import urlparse
+from bs4 import BeautifulSoup
+
+HEADINGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+NOISE_TAGS = ["script", "style", "nav", "header", "footer", "aside", "noscript", "svg", "form"]
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "its", "not", "of", "on",
+    "or", "see", "that", "the", "this", "to", "was", "were", "with", "more", "details", "here",
+}
+
+class DocExcerpter:
+    """
+    Picks out the parts of a documentation page that are relevant to a lint error, rather than passing
+    the whole page (often tens of KB) into the summary prompt.
+
+    The section the URL's #fragment points at is always included - or, for a URL without one, the section about the
+    error's actionlint rule (if `kind` is given).  The rest of the page is split into
+    chunks which are ranked against the error message with BM25, and the best `top_k` chunks are added
+    (in page order) until the `token_budget` is used up.
+    """
+
+    def __init__(self, token_budget: int = 1500, top_k: int = 6, chunk_words: int = 120):
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.chunk_words = chunk_words
+
+    def excerpt(self, html: str, url: str, error_message: str, kind: str | None = None) -> str:
+        soup = BeautifulSoup(html, 'html.parser')
+        for tag in soup(NOISE_TAGS):
+            tag.decompose()
+
+        budget = self.token_budget * 4  # roughly four characters to a token
+        section = self.find_section(soup, urlparse(url).fragment) or self.find_rule_section(soup, kind)
+        if section:
+            section = section[:budget]
+            budget -= len(section)
+
+        chunks = self.chunk(soup.get_text(separator="\n", strip=True))
+        scores = self.bm25(chunks, self.tokenise(error_message))
+        ranked = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+
+        selected = []
+        for i in ranked[:self.top_k]:
+            if scores[i] <= 0 or len(chunks[i]) > budget:
+                continue
+            # skip chunks which just repeat the section we already have
+            if section and (chunks[i] in section or section.splitlines()[0] in chunks[i].splitlines()):
+                continue
+            selected.append(i)
+            budget -= len(chunks[i])
+
+        parts = [section] if section else []
+        parts += [chunks[i] for i in sorted(selected)]
+        if not parts:
+            # nothing matched at all - fall back to the start of the page
+            return soup.get_text(separator="\n", strip=True)[:self.token_budget * 4]
+        return "\n\n...\n\n".join(parts)
+
+    def find_section(self, soup: BeautifulSoup, fragment: str) -> str:
+        """Returns the text of the section the URL fragment points at (from its heading to the next heading of the same level)"""
+        if not fragment:
+            return ""
+        element = soup.find(id=fragment) or soup.find(id=f"user-content-{fragment}") or soup.find(attrs={"name": fragment})
+        if element is None:
+            return ""
+
+        heading = element if element.name in HEADINGS else element.find_parent(HEADINGS)
+        if heading is None:
+            # an anchor on some other element (eg, a <section id=...>) - its own text is the section
+            return element.get_text(separator="\n", strip=True)
+        return self.heading_section(heading)
+
+    def find_rule_section(self, soup: BeautifulSoup, kind: str | None) -> str:
+        """
+        Returns the narrowest section which mentions the actionlint rule `[kind]` - each rule has its own section in
+        actionlint's checks.md, whose example output ends with the rule's kind
+        """
+        if not kind:
+            return ""
+        marker = f"[{kind}]"
+        sections = [self.heading_section(heading) for heading in soup.find_all(HEADINGS)]
+        if not sections:
+            # the page's markdown source rather than rendered HTML
+            sections = self.markdown_sections(soup.get_text())
+        matches = [section for section in sections if marker in section]
+        return min(matches, key=len) if matches else ""
+
+    def heading_section(self, heading) -> str:
+        """The text from a heading to the next heading of the same level"""
+        level = HEADINGS.index(heading.name)
+        lines = [heading.get_text(separator=" ", strip=True)]
+        start = heading
+        # headings are often wrapped (eg, GitHub's <div class="markdown-heading">) - the section follows the wrapper
+        while start.parent is not None and start.find_next_sibling() is None:
+            start = start.parent
+        for sibling in start.find_next_siblings():
+            if sibling.name in HEADINGS[:level + 1] or sibling.find(HEADINGS[:level + 1]):
+                break
+            text = sibling.get_text(separator="\n", strip=True)
+            if text:
+                lines.append(text)
+        return "\n".join(lines)
+
+    def markdown_sections(self, text: str) -> list[str]:
+        """Split markdown into sections, each running from a `#` heading to the next heading of the same level"""
+        headings = []
+        lines = text.splitlines()
+        fenced = False
+        for i, line in enumerate(lines):
+            if line.lstrip().startswith("```"):
+                fenced = not fenced
+            match = None if fenced else re.match(r"^(#{1,6})\s", line)
+            if match:
+                headings.append((i, len(match.group(1))))
+
+        sections = []
+        for n, (start, level) in enumerate(headings):
+            end = next((i for i, other in headings[n + 1:] if other <= level), len(lines))
+            section = "\n".join(line.strip() for line in lines[start:end] if line.strip())
+            sections.append(section)
+        return sections
+
+    def chunk(self, text: str) -> list[str]:
+        """Split the page into chunks of roughly `chunk_words` words, breaking on line boundaries"""
+        chunks = []
+        current = []
+        words = 0
+        for line in text.splitlines():
+            current.append(line)
+            words += len(line.split())
+            if words >= self.chunk_words:
+                chunks.append("\n".join(current))
+                current, words = [], 0
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    def tokenise(self, text: str) -> list[str]:
+        return [word for word in re.findall(r"[a-z0-9_.-]+", text.lower()) if word not in STOPWORDS and len(word) > 1]
+
+    def bm25(self, chunks: list[str], query: list[str], k1: float = 1.5, b: float = 0.75) -> list[float]:
+        documents = [Counter(self.tokenise(chunk)) for chunk in chunks]
+        if not documents:
+            return []
+        average_length = sum(sum(document.values()) for document in documents) / len(documents) or 1
+        document_frequency = Counter(term for document in documents for term in document)
+
+        scores = []
+        for document in documents:
+            length = sum(document.values())
+            score = 0.0
+            for term in set(query):
+                frequency = document.get(term, 0)
+                if not frequency:
+                    continue
+                idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+            scores.append(score)
+        return scores
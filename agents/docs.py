@@ -1,10 +1,17 @@
-import re
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from bs4 import BeautifulSoup
-from litellm import completion
-import litellm
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from requests.adapters import HTTPAdapter
 import logging
+from agents.docs_index import DocsIndex
+from agents.docs_store import DocsStore
+from agents.docs_summary import DocsSummaryAgent
+from agents.llm_cache import LLMCache
+from agents.rate_limit import RETRYABLE_STATUSES, get_limiter
+from agents.telemetry import Tracer
+from agents.validator import LintError
+from agents.doc_excerpt import DocExcerpter
 
 logger = logging.getLogger('gl2gh')
 
@@ -15,54 +22,90 @@ class DocumentationSummarizer:
       - If not, fetch the documentation content and use an LLM to generate a summary
         using the error message as context.
       - Returns a list of dictionaries for each error with its URL, error message, and summary.
+
+    Distinct errors are fetched and summarised concurrently (up to `max_concurrency` at a time)
+    over a pooled HTTP session, so N errors cost roughly one round trip rather than N.  A long-running process can
+    pass in one `session` for every conversion, so their connections stay open between them.
+
+    If a `DocsStore` is given, fetched pages and summaries are also persisted between runs.
+
+    Only the relevant parts of each page (see `DocExcerpter`), up to `token_budget` tokens, go into the summary prompt.
+
+    If a `DocsIndex` is given, its pre-written guidance is used first - for errors with a URL and for errors whose
+    actionlint rule it covers - and only errors it doesn't cover are fetched.  With `offline` set, they never are.
     """
 
-    def __init__(self, model_name: str = "o3-mini", provider: str = "openai"):
+    def __init__(self, model_name: str = "o3-mini", provider: str = "openai", max_concurrency: int = 4,
+                 store: DocsStore | None = None, token_budget: int = 1500, cache: LLMCache | None = None,
+                 tracer: Tracer | None = None, index: DocsIndex | None = None, offline: bool = False,
+                 session: requests.Session | None = None):
         # Cache to store summaries keyed by (url, error_message)
         self.cache = {}
-        self.env = Environment(
-            loader=FileSystemLoader("prompts"),
-            autoescape=select_autoescape()
-        )
+        self.store = store
+        self.index = index
+        self.offline = offline
+        self.index_hits = 0
+        self.excerpter = DocExcerpter(token_budget=token_budget)
+        self.cache_lock = threading.Lock()
+        self.max_concurrency = max(1, max_concurrency)
+        self.session = session or make_session(self.max_concurrency)
         self.model_name = model_name
         self.provider = provider
+        self.tracer = tracer or Tracer()
+        self.summary_agent = DocsSummaryAgent(model_name=model_name, provider=provider, cache=cache, tracer=self.tracer)
 
     def get_full_model_name(self) -> str:
         return f"{self.provider}/{self.model_name}"
 
-    def fetch_content(self, url: str) -> str:
+    def fetch_page(self, url: str) -> str:
         """
-        Fetches and extracts text content from the given URL using requests and BeautifulSoup.
+        Fetches the raw HTML for the given URL - using the persistent store (and conditional requests) if we have one.
         """
-        try:
-            logger.debug(f"Fetching content from {url}")
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()  # Ensure we catch HTTP errors
-            soup = BeautifulSoup(response.text, 'html.parser')
-            return soup.get_text(separator='\n', strip=True)
-        except Exception as e:
-            logger.error(f"Error fetching content: {str(e)}")
-            return f"Error fetching content: {str(e)}"
+        cached = self.store.get_page(url) if self.store else None
+        if cached and cached["fresh"]:
+            logger.debug(f"Using stored page for {url}")
+            self.store.record_saved_fetch()
+            return cached["content"]
+
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        logger.debug(f"Fetching content from {url}")
+        response = get_limiter(urlparse(url).netloc, max_retries=2).call(lambda: self.get(url, headers))
+        if cached and response.status_code == 304:
+            logger.debug(f"Stored page for {url} is still valid")
+            self.store.touch_page(url)
+            self.store.record_saved_fetch()
+            return cached["content"]
+        response.raise_for_status()  # Ensure we catch HTTP errors
+
+        if self.store:
+            self.store.put_page(url, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return response.text
+
+    def get(self, url: str, headers: dict) -> requests.Response:
+        response = self.session.get(url, headers=headers, timeout=10)
+        if response.status_code in RETRYABLE_STATUSES:
+            # raise so the limiter backs off and tries again
+            response.raise_for_status()
+        return response
 
     def summarize(self, error_message: str, content: str, implementation: str) -> str:
-        template = self.env.get_template("docs_summary.md")
-        prompt = template.render(error_message=error_message, page_content=content, workflow_yaml=implementation)
         logger.debug(f"Summarizing docs content with {self.get_full_model_name()}")
-        litellm.drop_params = True
-        response = completion(
-            model=self.get_full_model_name(),
-            messages=[{"role": "user", "content": prompt}],
-        )
-
-        logger.debug(f"Summarized docs content: {response.choices[0].message.content}")
-        return response.choices[0].message.content
+        summary, cost = self.summary_agent.run(error_message=error_message, page_content=content, workflow_yaml=implementation)
+        logger.debug(f"Summarized docs content (cost: US${cost}): {summary}")
+        return summary
 
-    def process_errors(self, lint_errors: str, implementation: str, docs: list) -> list:
+    def process_errors(self, lint_errors: list[LintError], implementation: str, docs: list) -> list:
         """
         Processes the lint errors, checking for existing summaries, fetching content, and summarizing as needed.
 
         Args:
-            lint_errors (str): A string containing multiple lint errors.
+            lint_errors (list[LintError]): The errors reported by actionlint.
 
         Returns:
             list: A list of dictionaries, each with keys "url", "error", and "summary".
@@ -73,33 +116,28 @@ class DocumentationSummarizer:
 
         logger.debug(f"Lint errors: {lint_errors}")
         logger.debug("-" * 100)
-        # Regex to extract error messages and associated URLs.
-        pattern = r'^\d+:\d+:\s+(.*?)\s+see\s+(https?://[^\s]+)'
-        error_details = re.findall(pattern, lint_errors, re.MULTILINE)
-        logger.debug(f"Error details: {error_details}")
-        logger.debug("-" * 100)
-        # make error_details unique
-        error_details = list(set(error_details))
-        logger.debug(f"Unique error details: {error_details}")
+        # only errors which point at some documentation (or which the index has guidance for) are of use here - and
+        # we only need each one once
+        keys = []
+        kinds = {}
+        for error in lint_errors:
+            url = error.url
+            if not url and self.index and error.kind in self.index.rules:
+                url = self.index.rules[error.kind]["url"]
+            key = (url, error.message.strip())
+            if url and key not in keys:
+                keys.append(key)
+                kinds[key] = error.kind
+        logger.debug(f"Unique error details: {keys}")
         logger.debug("-" * 100)
 
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            summaries = list(executor.map(lambda key: self.get_summary(key, implementation, kinds[key]), keys))
+
         results = []
-        for error_message, url in error_details:
-            error_message = error_message.strip()
-            if not url.startswith("https://"):
-                temp = url
-                url = error_message
-                error_message = temp
-            key = (url, error_message)
-
-            if key not in self.cache:
-                logger.debug(f"- Getting new docs summary for {url}")
-                content = self.fetch_content(url)
-                summary = self.summarize(error_message, content, implementation)
-                self.cache[key] = summary
-            else:
-                logger.debug(f"- Using cached summary for {url}")
-                summary = self.cache[key]
+        for (url, error_message), summary in zip(keys, summaries):
+            if not summary:
+                continue
             results.append({
                 "url": url,
                 "error": error_message,
@@ -112,3 +150,64 @@ class DocumentationSummarizer:
             })
 
         return results, docs
+
+    def get_summary(self, key: tuple[str, str], implementation: str, kind: str | None = None) -> str:
+        """Returns the summary for a (url, error_message) pair, fetching and summarising the docs if we haven't already"""
+        url, error_message = key
+        with self.cache_lock:
+            summary = self.cache.get(key)
+        if summary is not None:
+            logger.debug(f"- Using cached summary for {url}")
+            return summary
+
+        summary = self.index.get(url, kind) if self.index else None
+        if summary is not None:
+            logger.debug(f"- Using indexed guidance for {url} ({kind})")
+            with self.cache_lock:
+                self.cache[key] = summary
+                self.index_hits += 1
+            return summary
+        if self.offline:
+            logger.debug(f"- No indexed guidance for {url} ({kind}) and we're offline - skipping it")
+            return ""
+
+        if self.store:
+            summary = self.store.get_summary(url, error_message)
+            if summary is not None:
+                logger.debug(f"- Using stored summary for {url}")
+                self.store.record_saved_summary()
+                with self.cache_lock:
+                    self.cache[key] = summary
+                return summary
+
+        logger.debug(f"- Getting new docs summary for {url}")
+        fetched = True
+        try:
+            with self.tracer.span("docs_fetch", url=url):
+                html = self.fetch_page(url)
+            content = self.excerpter.excerpt(html, url, error_message, kind)
+        except Exception as e:
+            logger.error(f"Error fetching content: {str(e)}")
+            content = f"Error fetching content: {str(e)}"
+            fetched = False
+        logger.debug(f"Docs excerpt for {url} ({len(content)} chars):\n{content}")
+        try:
+            summary = self.summarize(error_message, content, implementation)
+        except Exception as e:
+            # a missing summary just means less help for the debugger - it shouldn't stop the conversion
+            logger.error(f"Error summarising docs for {url}: {str(e)}")
+            return ""
+        with self.cache_lock:
+            self.cache[key] = summary
+        if self.store and fetched:
+            # don't persist summaries of pages we failed to fetch - they'd stop us retrying next run
+            self.store.put_summary(url, error_message, summary)
+        return summary
+
+def make_session(max_connections: int = 4) -> requests.Session:
+    """An HTTP session which keeps up to `max_connections` connections to each docs host open"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,60 @@
+import json
+import logging
+import time
+from urllib.parse import urldefrag
+from agents.base_agent import BaseAgent
+
+logger = logging.getLogger('gl2gh')
+
+DEFAULT_INDEX_PATH = "data/actionlint_docs_index.json"
+
+class DocsIndex:
+    """
+    Pre-summarised guidance for actionlint's errors, shipped with the tool so most errors can be explained without
+    fetching (or paying to summarise) any documentation - and so it works with no network at all.
+
+    The index maps the documentation URLs actionlint puts in its messages (anchor and all) and actionlint's rule
+    kinds (`expression`, `job-needs`, ...) to guidance.  A URL is looked up first, then the same page without its
+    anchor, then the error's kind.  `build_docs_index.py` rebuilds it from a snapshot of the docs.
+    """
+
+    version = 1
+
+    def __init__(self, pages: dict | None = None, rules: dict | None = None, built: float | None = None):
+        self.pages = pages or {}
+        self.rules = rules or {}
+        self.built = built
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH) -> "DocsIndex | None":
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load the docs index from {path}: {e}")
+            return None
+        if data.get("version") != cls.version:
+            logger.warning(f"Ignoring the docs index in {path} - it was built by an incompatible version")
+            return None
+        logger.debug(f"Loaded docs index with {len(data['pages'])} pages and {len(data['rules'])} rules from {path}")
+        return cls(data["pages"], data["rules"], data.get("built"))
+
+    def get(self, url: str | None, kind: str | None = None) -> str | None:
+        """The guidance for an error with this docs URL and/or actionlint rule kind, if we have any"""
+        if url:
+            for candidate in (url, urldefrag(url).url):
+                if candidate in self.pages:
+                    return self.pages[candidate]["guidance"]
+        if kind and kind in self.rules:
+            return self.rules[kind]["guidance"]
+        return None
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"version": self.version, "built": self.built or time.time(), "pages": self.pages, "rules": self.rules},
+                      f, indent=2, sort_keys=True)
+            f.write("\n")
+
+class DocsIndexAgent(BaseAgent):
+    """Summarises a docs page into general guidance for an actionlint rule (used when building the index)"""
+    prompt_file: str = "docs_index_summary.md"
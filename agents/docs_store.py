@@ -0,0 +1,114 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+logger = logging.getLogger('gl2gh')
+
+class DocsStore:
+    """
+    A persistent (SQLite) store for fetched documentation pages and their LLM summaries, so that
+    separate runs don't re-download the same docs pages or pay again to summarise the same (url, error) pairs.
+
+    Pages younger than `page_ttl_days` are used as-is.  Older pages are revalidated with the ETag / Last-Modified
+    headers from the original response, so an unchanged page only costs a `304 Not Modified`.
+    Summaries are kept for `summary_ttl_days`.
+    """
+
+    def __init__(self, path: str = ".gl2gh_cache/docs.sqlite3", page_ttl_days: float = 7, summary_ttl_days: float = 30):
+        self.path = path
+        self.page_ttl = page_ttl_days * 24 * 60 * 60
+        self.summary_ttl = summary_ttl_days * 24 * 60 * 60
+        self.fetches_saved = 0
+        self.summaries_saved = 0
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self.connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    url TEXT NOT NULL,
+                    error TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (url, error)
+                )
+            """)
+
+    def connect(self) -> sqlite3.Connection:
+        # a connection per call keeps things safe when the docs are fetched from several threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_page(self, url: str) -> dict | None:
+        """Returns the stored page (content, etag, last_modified and whether it is still fresh) or None"""
+        with closing(self.connect()) as conn:
+            row = conn.execute(
+                "SELECT content, etag, last_modified, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        content, etag, last_modified, fetched_at = row
+        return {
+            "content": content,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fresh": time.time() - fetched_at < self.page_ttl,
+        }
+
+    def put_page(self, url: str, content: str, etag: str | None = None, last_modified: str | None = None):
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (url, content, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, content, etag, last_modified, time.time()),
+            )
+
+    def touch_page(self, url: str):
+        """Mark a page as fresh again (after the server told us it hasn't changed)"""
+        with closing(self.connect()) as conn, conn:
+            conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def get_summary(self, url: str, error: str) -> str | None:
+        with closing(self.connect()) as conn:
+            row = conn.execute(
+                "SELECT summary FROM summaries WHERE url = ? AND error = ? AND created_at > ?",
+                (url, error, time.time() - self.summary_ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_summary(self, url: str, error: str, summary: str):
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (url, error, summary, created_at) VALUES (?, ?, ?, ?)",
+                (url, error, summary, time.time()),
+            )
+
+    def record_saved_fetch(self):
+        with self.lock:
+            self.fetches_saved += 1
+
+    def record_saved_summary(self):
+        with self.lock:
+            self.summaries_saved += 1
+
+    def purge_expired(self):
+        """Remove pages and summaries that are well past their TTL"""
+        now = time.time()
+        with closing(self.connect()) as conn, conn:
+            # stale pages are kept for a while longer as they can still be revalidated cheaply
+            conn.execute("DELETE FROM pages WHERE fetched_at < ?", (now - self.page_ttl * 4,))
+            conn.execute("DELETE FROM summaries WHERE created_at < ?", (now - self.summary_ttl,))
+
+    def stats(self) -> str:
+        return f"{self.fetches_saved} page fetches and {self.summaries_saved} summary calls saved"
@@ -0,0 +1,4 @@
+from agents.base_agent import BaseAgent
+
+class DocsSummaryAgent(BaseAgent):
+    prompt_file: str = "docs_summary.md"
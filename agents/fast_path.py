@@ -0,0 +1,219 @@
+import re
+import yaml
+from agents.pipeline import GitLabPipeline
+from agents.yaml_utils import dump_yaml
+
+# top-level keys (other than jobs) the translator understands
+SUPPORTED_GLOBAL_KEYS = {"stages", "variables", "default", "image", "before_script", "after_script"}
+SUPPORTED_DEFAULT_KEYS = {"image", "before_script", "after_script"}
+SUPPORTED_JOB_KEYS = {"stage", "image", "script", "before_script", "after_script", "variables", "only", "except", "rules", "needs", "when", "allow_failure", "extends", "inherit"}
+
+# GitLab predefined variables with an exact GitHub equivalent (for push events) - any others send the pipeline to the
+# LLM rather than being approximated.  CI_JOB_NAME is the job's own name, so it's filled in per job
+PREDEFINED_VARIABLES = {
+    "CI_COMMIT_SHA": "${{ github.sha }}",
+    "CI_COMMIT_BRANCH": "${{ github.ref_type == 'branch' && github.ref_name || '' }}",
+    "CI_COMMIT_REF_NAME": "${{ github.ref_name }}",
+    "CI_COMMIT_TAG": "${{ github.ref_type == 'tag' && github.ref_name || '' }}",
+    "CI_PROJECT_DIR": "${{ github.workspace }}",
+    "CI_PROJECT_NAME": "${{ github.event.repository.name }}",
+    "CI_PROJECT_PATH": "${{ github.repository }}",
+    "CI_PIPELINE_ID": "${{ github.run_id }}",
+    "CI_DEFAULT_BRANCH": "${{ github.event.repository.default_branch }}",
+}
+PREDEFINED_VARIABLE_RE = re.compile(r"\$\{?((?:CI|GITLAB)_[A-Z0-9_]+)")
+BRANCH_RULE_RE = re.compile(r"""^\s*\$(?:CI_COMMIT_BRANCH|CI_COMMIT_REF_NAME)\s*(==|!=)\s*["']([^"'$]+)["']\s*$""")
+BRANCH_NAME_RE = re.compile(r"^[A-Za-z0-9._/-]+$")
+# images without glibc (or a shell) - JavaScript actions like actions/checkout can't run in them.  The official docker
+# image is Alpine based
+NON_GLIBC_IMAGE_RE = re.compile(r"alpine|distroless|busybox|musl|^(scratch|docker)(:|@|$)", re.IGNORECASE)
+
+class FastPathTranslator():
+    """
+    A deterministic, rule-based translator for simple pipelines - `stages`, `image`, `script`, `variables` and
+    branch filters with `only`/`except`/`rules` - so they don't need any LLM calls at all.
+
+    `run` returns the translated workflow along with a list of the reasons it couldn't translate everything.
+    When that list is empty the workflow is a complete translation; otherwise it is a partial draft.
+    """
+
+    def run(self, gitlab_yaml: str) -> tuple[str, list[str]]:
+        try:
+            pipeline = GitLabPipeline(gitlab_yaml)
+        except (ValueError, yaml.YAMLError) as e:
+            return "", [f"could not parse the pipeline: {e}"]
+
+        unsupported = []
+        for key in pipeline.global_context:
+            if key not in SUPPORTED_GLOBAL_KEYS:
+                unsupported.append(f"top-level `{key}`")
+        for key in (pipeline.raw.get("default") or {}):
+            if key not in SUPPORTED_DEFAULT_KEYS:
+                unsupported.append(f"`default:{key}`")
+        if not pipeline.jobs:
+            unsupported.append("no jobs")
+
+        workflow = {"name": "CI", "on": {"push": None}}
+        env = self.translate_variables(pipeline.raw.get("variables") or {}, "top-level", unsupported)
+        if env:
+            workflow["env"] = env
+
+        job_ids = pipeline.job_ids()
+        conditions = {}
+        jobs = {}
+        for name, job in pipeline.jobs.items():
+            jobs[job_ids[name]], conditions[job_ids[name]] = self.translate_job(name, job, pipeline, job_ids, unsupported)
+
+        for job_id, job in jobs.items():
+            condition = conditions[job_id]
+            # a job whose `needs` were skipped by their branch filters would be skipped too - but not in GitLab
+            if any(conditions.get(needed) for needed in job.get("needs", [])):
+                condition = f"!failure() && !cancelled() && ({condition})" if condition else "!failure() && !cancelled()"
+            if condition:
+                job["if"] = condition
+                # keep `if` near the top, where people expect to find it
+                jobs[job_id] = {"if": job.pop("if"), **job}
+        workflow["jobs"] = jobs
+
+        return dump_yaml(workflow), unsupported
+
+    def translate_job(self, name: str, job: dict, pipeline: GitLabPipeline, job_ids: dict, unsupported: list[str]) -> tuple[dict, str]:
+        for key in job:
+            if key not in SUPPORTED_JOB_KEYS:
+                unsupported.append(f"`{key}` in job {name!r}")
+        if set(job.get("inherit") or {}) - {"default"}:
+            unsupported.append(f"`inherit` options in job {name!r}")
+        if job.get("when", "on_success") != "on_success":
+            unsupported.append(f"`when: {job['when']}` in job {name!r}")
+
+        translated = {"runs-on": "ubuntu-latest"}
+        needs = self.translate_needs(name, job, pipeline, job_ids, unsupported)
+        if needs:
+            translated["needs"] = needs
+
+        image = job.get("image")
+        if isinstance(image, dict):
+            if set(image) != {"name"}:
+                unsupported.append(f"`image` options in job {name!r}")
+            image = image.get("name")
+        if image:
+            if NON_GLIBC_IMAGE_RE.search(str(image)):
+                unsupported.append(f"non-glibc image `{image}` in job {name!r}")
+            translated["container"] = str(image)
+        if job.get("allow_failure") is True:
+            translated["continue-on-error"] = True
+
+        env = self.translate_variables(job.get("variables") or {}, f"job {name!r}", unsupported)
+        scripts = {key: self.script_lines(job.get(key)) for key in ("before_script", "script", "after_script")}
+        for line in sum(scripts.values(), []):
+            for variable in PREDEFINED_VARIABLE_RE.findall(line):
+                if variable == "CI_JOB_NAME":
+                    env.setdefault(variable, name)
+                elif variable == "CI_PROJECT_DIR" and image:
+                    # github.workspace is the path on the runner, not the one mounted in the container
+                    unsupported.append(f"predefined variable `{variable}` in container job {name!r}")
+                elif variable in PREDEFINED_VARIABLES:
+                    env.setdefault(variable, PREDEFINED_VARIABLES[variable])
+                else:
+                    unsupported.append(f"predefined variable `{variable}` in job {name!r}")
+        if env:
+            translated["env"] = env
+
+        if not scripts["script"]:
+            unsupported.append(f"no `script` in job {name!r}")
+        steps = [{"uses": "actions/checkout@v4"}]
+        steps.append({"name": "Run script", "run": "\n".join(scripts["before_script"] + scripts["script"]) + "\n"})
+        if scripts["after_script"]:
+            steps.append({"name": "Run after_script", "if": "always()", "run": "\n".join(scripts["after_script"]) + "\n"})
+        translated["steps"] = steps
+
+        return translated, self.translate_condition(name, job, unsupported)
+
+    def translate_needs(self, name: str, job: dict, pipeline: GitLabPipeline, job_ids: dict, unsupported: list[str]) -> list[str]:
+        if "needs" in job:
+            needs = []
+            for need in job["needs"] or []:
+                needed = need.get("job") if isinstance(need, dict) else need
+                if needed not in job_ids or (isinstance(need, dict) and set(need) - {"job"}):
+                    unsupported.append(f"`needs: {need}` in job {name!r}")
+                    continue
+                needs.append(job_ids[needed])
+            return needs
+
+        # without `needs`, a job waits for every job in the stages before it
+        stage = pipeline.stage_index(pipeline.job_stage(name))
+        earlier = [pipeline.stage_index(pipeline.job_stage(other)) for other in pipeline.jobs]
+        previous = max((index for index in earlier if index < stage), default=None)
+        if previous is None:
+            return []
+        return [job_ids[other] for other in pipeline.jobs if pipeline.stage_index(pipeline.job_stage(other)) == previous]
+
+    def translate_condition(self, name: str, job: dict, unsupported: list[str]) -> str:
+        conditions = []
+        if "only" in job:
+            refs = self.refs(job["only"], name, unsupported)
+            conditions.append(" || ".join(self.ref_condition(ref, "==") for ref in refs))
+        if "except" in job:
+            refs = self.refs(job["except"], name, unsupported)
+            conditions.append(" && ".join(self.ref_condition(ref, "!=") for ref in refs))
+        if "rules" in job:
+            rule_conditions = []
+            for rule in job["rules"] or []:
+                match = BRANCH_RULE_RE.match(str(rule.get("if", ""))) if isinstance(rule, dict) else None
+                if not match or set(rule) - {"if", "when"} or rule.get("when", "on_success") != "on_success":
+                    unsupported.append(f"rule {rule} in job {name!r}")
+                    continue
+                rule_conditions.append(self.ref_condition(match.group(2), match.group(1)))
+            if rule_conditions:
+                conditions.append(" || ".join(rule_conditions))
+
+        conditions = [condition for condition in conditions if condition]
+        if len(conditions) > 1:
+            return " && ".join(f"({condition})" for condition in conditions)
+        return conditions[0] if conditions else ""
+
+    def refs(self, value, name: str, unsupported: list[str]) -> list[str]:
+        if isinstance(value, dict):
+            if set(value) != {"refs"}:
+                unsupported.append(f"`only`/`except` options in job {name!r}")
+            value = value.get("refs", [])
+        if isinstance(value, str):
+            value = [value]
+        refs = []
+        for ref in value or []:
+            if ref in ("branches", "tags") or (isinstance(ref, str) and BRANCH_NAME_RE.match(ref)):
+                refs.append(ref)
+            else:
+                unsupported.append(f"ref filter {ref!r} in job {name!r}")
+        return refs
+
+    def ref_condition(self, ref: str, operator: str) -> str:
+        if ref == "branches":
+            return "startsWith(github.ref, 'refs/heads/')" if operator == "==" else "!startsWith(github.ref, 'refs/heads/')"
+        if ref == "tags":
+            return "startsWith(github.ref, 'refs/tags/')" if operator == "==" else "!startsWith(github.ref, 'refs/tags/')"
+        return f"github.ref {operator} 'refs/heads/{ref}'"
+
+    def translate_variables(self, variables: dict, where: str, unsupported: list[str]) -> dict:
+        env = {}
+        for key, value in variables.items():
+            if isinstance(value, dict):
+                if set(value) - {"value", "description"}:
+                    unsupported.append(f"variable options for `{key}` ({where})")
+                value = value.get("value", "")
+            if isinstance(value, (dict, list)):
+                unsupported.append(f"variable `{key}` ({where})")
+                continue
+            value = "" if value is None else str(value).lower() if isinstance(value, bool) else str(value)
+            if "$" in value:
+                # GitLab expands variables inside variable values, GitHub's `env` doesn't
+                unsupported.append(f"variable `{key}` refers to other variables ({where})")
+            env[str(key)] = value
+        return env
+
+    def script_lines(self, script) -> list[str]:
+        if script is None:
+            return []
+        if isinstance(script, str):
+            return [script]
+        return [str(line) for line in script]
@@ -2,3 +2,4 @@ from agents.base_agent import BaseAgent
 
 class ImplementationAgent(BaseAgent):
     prompt_file: str = "implementation.md"
+    system_prompt_file: str = "conversion_context.md"
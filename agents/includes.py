@@ -0,0 +1,310 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+import yaml
+from agents.base_agent import BaseAgent
+from agents.pipeline import DEFAULT_KEYWORDS, GLOBAL_KEYWORDS, GitLabLoader, GitLabPipeline, deep_merge, job_id
+from agents.yaml_utils import dump_yaml, load_workflow
+
+logger = logging.getLogger('gl2gh')
+
+# GitLab's own limit on how deeply includes can be nested
+MAX_INCLUDE_DEPTH = 100
+
+@dataclass
+class IncludedFile:
+    """A local file pulled in by `include:` - `raw` has its own local includes merged in already"""
+    path: str
+    raw: dict
+    depth: int = 0
+
+    @property
+    def job_names(self) -> list[str]:
+        return visible_jobs(self.raw)
+
+@dataclass
+class SharedWorkflow:
+    """A shared include converted into a reusable GitHub workflow, and the job which calls it"""
+    path: str
+    name: str
+    job_id: str
+    jobs: list[str]
+    workflow: str = ""
+    reused: bool = False
+    filename: str = field(default="", repr=False)
+    # the GitHub job ids of the pipeline's own jobs which the calling job waits for, and which wait for it
+    needs: list[str] = field(default_factory=list)
+    needed_by: list[str] = field(default_factory=list)
+
+    @property
+    def uses(self) -> str:
+        return f"./.github/workflows/{self.name}.yml"
+
+    def to_dict(self) -> dict:
+        return {"path": self.path, "name": self.name, "job_id": self.job_id, "jobs": self.jobs,
+                "workflow": self.workflow, "reused": self.reused, "filename": self.filename,
+                "needs": self.needs, "needed_by": self.needed_by}
+
+class IncludeResolver:
+    """
+    Merges a pipeline's local `include:` files (`include: 'ci/build.yml'`, `include: {local: ...}` and `*` globs)
+    into it the way GitLab does - each included file in order, then the pipeline itself deep-merged on top.  Paths
+    are relative to `root`, the repository the pipeline belongs to.
+
+    Remote, project and template includes can't be read from here, so they're left in `include:` for the LLM.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def resolve(self, gitlab_yaml: str) -> tuple[str, list[IncludedFile]]:
+        """Returns the pipeline with its local includes merged in (unchanged if it has none) and the files included"""
+        try:
+            raw = yaml.load(gitlab_yaml, Loader=GitLabLoader)
+        except yaml.YAMLError:
+            return gitlab_yaml, []
+        if not isinstance(raw, dict) or not raw.get("include"):
+            return gitlab_yaml, []
+        merged, included = self.merge(raw)
+        if not included:
+            return gitlab_yaml, []
+        logger.info(f"Merged {len(included)} local includes: {', '.join(file.path for file in included)}")
+        return dump_yaml(merged), included
+
+    def merge(self, raw: dict, depth: int = 0, seen: tuple = ()) -> tuple[dict, list[IncludedFile]]:
+        merged = {}
+        included = []
+        remaining = []
+        for entry in include_entries(raw.get("include")):
+            filenames = self.find(entry)
+            if not filenames:
+                remaining.append(entry)
+                continue
+            for filename in filenames:
+                path = os.path.relpath(filename, self.root)
+                if filename in seen or depth >= MAX_INCLUDE_DEPTH:
+                    logger.warning(f"Not including {path} again (circular or too deeply nested includes)")
+                    continue
+                try:
+                    with open(filename, "r") as f:
+                        body = yaml.load(f, Loader=GitLabLoader) or {}
+                except (OSError, yaml.YAMLError) as e:
+                    logger.warning(f"Could not read included file {path}: {e}")
+                    remaining.append(entry)
+                    continue
+                if not isinstance(body, dict):
+                    logger.warning(f"Included file {path} is not a YAML mapping - ignoring it")
+                    continue
+                body, nested = self.merge(body, depth + 1, seen + (filename,))
+                included.extend(nested)
+                included.append(IncludedFile(path=path, raw=body, depth=depth))
+                merged = deep_merge(merged, body)
+
+        merged = deep_merge(merged, {key: value for key, value in raw.items() if key != "include"})
+        if remaining:
+            merged = {"include": remaining, **merged}
+        return merged, included
+
+    def find(self, entry) -> list[str]:
+        """The local files an `include:` entry refers to (an empty list for remote/project/template includes)"""
+        path = entry.get("local") if isinstance(entry, dict) else entry
+        if not isinstance(path, str) or "://" in path:
+            return []
+        pattern = os.path.join(self.root, path.lstrip("/"))
+        filenames = sorted(glob.glob(pattern, recursive=True)) if "*" in path else [pattern]
+        # never read outside the repository
+        return [os.path.abspath(name) for name in filenames
+                if os.path.isfile(name) and os.path.abspath(name).startswith(self.root + os.sep)]
+
+class SharedWorkflowAgent(BaseAgent):
+    """Converts the jobs of a shared include into a reusable workflow (`on: workflow_call`)"""
+    prompt_file: str = "shared_workflow.md"
+
+    def run_include(self, path: str, pipeline: GitLabPipeline, names: list[str]) -> tuple[str, float]:
+        """Convert the jobs `names` as they are in `pipeline` - with the variables and defaults they inherit from it"""
+        return self.run(
+            include_path=path,
+            global_context=include_context(pipeline, names),
+            jobs_yaml=pipeline.jobs_yaml(names),
+        )
+
+class SharedWorkflowLibrary:
+    """
+    Converted shared includes, stored under `directory` by a hash of their jobs as the including pipeline sees them -
+    with the defaults they inherit resolved, plus the pipeline's variables and workflow rules - so formatting,
+    comments and key order don't matter, but a pipeline which gives the jobs a different image or variables doesn't
+    get a conversion made for another one.  Every pipeline which includes the same file with the same settings - in
+    this run or a later one - reuses the first conversion instead of paying for it again.
+    """
+
+    # one lock per include, shared by every converter in the process, so a batch converts each include only once
+    locks = {}
+    locks_lock = threading.Lock()
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, pipeline: GitLabPipeline, names: list[str]) -> str:
+        normalised = json.dumps({"context": include_context(pipeline, names), "jobs": {name: pipeline.jobs[name] for name in names}},
+                                sort_keys=True, default=str)
+        return hashlib.sha256(normalised.encode("utf-8")).hexdigest()
+
+    def lock(self, key: str) -> threading.Lock:
+        with self.locks_lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def get(self, key: str) -> str | None:
+        if not self.directory:
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{key}.yml"), "r") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key: str, workflow: str):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"{key}.yml")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(workflow)
+        os.replace(temp_path, path)
+
+def include_context(pipeline: GitLabPipeline, names: list[str]) -> str:
+    """The pipeline-wide settings the jobs `names` inherit (variables, workflow rules, ...) and just the stages they use"""
+    stages = {pipeline.job_stage(name) for name in names}
+    context = {key: value for key, value in pipeline.global_context.items() if key not in DEFAULT_KEYWORDS and key != "default"}
+    context["stages"] = [stage for stage in pipeline.stages if stage in stages]
+    return dump_yaml(context)
+
+def include_entries(include) -> list:
+    if not include:
+        return []
+    return include if isinstance(include, list) else [include]
+
+def visible_jobs(raw: dict) -> list[str]:
+    return [str(name) for name, body in raw.items()
+            if name not in GLOBAL_KEYWORDS and isinstance(body, dict) and not str(name).startswith(".")]
+
+def shareable_includes(source_yaml: str, merged_yaml: str, included: list[IncludedFile]) -> list[IncludedFile]:
+    """
+    The directly included files whose jobs can be split out into a reusable workflow - ones which define jobs the
+    pipeline itself doesn't override or depend on, which make sense on their own (no `extends` of templates
+    defined elsewhere), and which don't run in between the pipeline's own stages.
+    """
+    try:
+        own = yaml.load(source_yaml, Loader=GitLabLoader) or {}
+        merged = yaml.load(merged_yaml, Loader=GitLabLoader) or {}
+        pipeline = GitLabPipeline(merged_yaml)
+    except (ValueError, yaml.YAMLError):
+        return []
+    shared = []
+    claimed = set()
+    for file in included:
+        names = file.job_names
+        if file.depth or not names or claimed & set(names) or any(name in own for name in names):
+            continue
+        try:
+            GitLabPipeline(dump_yaml(file.raw))
+        except (ValueError, yaml.YAMLError):
+            logger.debug(f"{file.path} isn't self-contained - converting its jobs with the pipeline")
+            continue
+        dependants = [name for name in visible_jobs(merged) if name not in names and depends_on(merged[name], names)]
+        if dependants:
+            logger.debug(f"Jobs {dependants} depend on jobs from {file.path} - converting them with the pipeline")
+            continue
+        needs, needed_by = stage_dependencies(pipeline, names)
+        if set(needs) & set(needed_by):
+            # the calling job would have to both wait for and be waited on by the same jobs
+            logger.debug(f"The jobs from {file.path} are interleaved with the pipeline's stages - converting them with the pipeline")
+            continue
+        claimed.update(names)
+        shared.append(file)
+    return shared
+
+def depends_on(job: dict, names: list[str]) -> bool:
+    needed = []
+    for need in (job.get("needs") or []) + (job.get("dependencies") or []):
+        needed.append(need.get("job") if isinstance(need, dict) else need)
+    return any(name in names for name in needed)
+
+def stage_dependencies(pipeline: GitLabPipeline, names: list[str]) -> tuple[list[str], list[str]]:
+    """
+    The GitHub job ids of the pipeline's other jobs which the jobs `names` wait for, and of those which wait for them -
+    from their `needs:` and `dependencies:` where they have them, otherwise from GitLab's stage order (a job waits for
+    every job in the earlier stages).
+    """
+    ids = pipeline.job_ids()
+    others = [name for name in pipeline.jobs if name not in names]
+    stage = {name: pipeline.stage_index(pipeline.job_stage(name)) for name in pipeline.jobs}
+    needs = []
+    for name in names:
+        job = pipeline.jobs[name]
+        if "needs" in job:
+            needed = [need.get("job") if isinstance(need, dict) else need for need in job.get("needs") or []]
+        else:
+            needed = [other for other in others if stage[other] < stage[name]]
+        needed += list(job.get("dependencies") or [])
+        needs.extend(ids[other] for other in others if other in needed and ids[other] not in needs)
+    first_stage = min(stage[name] for name in names)
+    needed_by = [ids[other] for other in others if "needs" not in pipeline.jobs[other] and stage[other] > first_stage]
+    return needs, needed_by
+
+def without_jobs(gitlab_yaml: str, shared: list[SharedWorkflow]) -> str:
+    """The pipeline minus the jobs which have moved to reusable workflows, with a note for the LLM about where they went"""
+    raw = yaml.load(gitlab_yaml, Loader=GitLabLoader)
+    notes = []
+    for workflow in shared:
+        for name in workflow.jobs:
+            raw.pop(name, None)
+        notes.append(f"# - the jobs {', '.join(workflow.jobs)} (from {workflow.path}) are already converted into the reusable "
+                     f"workflow {workflow.uses}, which is called by the GitHub job `{workflow.job_id}`")
+    header = ["# NOTE: some jobs from this pipeline's shared includes have been converted separately:"] + notes + [
+        "# Do not convert those jobs again or add the calling jobs yourself - they are added automatically.",
+        "# The calling jobs' `needs:` refer to the other jobs by their GitLab names in lower case with dashes (eg `build-image`),",
+        "# so use those as the GitHub job ids.",
+    ]
+    return "\n".join(header) + "\n" + dump_yaml(raw)
+
+def add_calling_jobs(implementation: str, shared: list[SharedWorkflow]) -> str:
+    """Adds a job calling each reusable workflow to the converted pipeline"""
+    try:
+        workflow = load_workflow(implementation)
+    except (ValueError, yaml.YAMLError):
+        return implementation
+    jobs = workflow.get("jobs")
+    if not isinstance(jobs, dict):
+        return implementation
+    for shared_workflow in shared:
+        # keep GitLab's stage order between the shared jobs and the pipeline's own (where the LLM kept their job ids)
+        calling_job = {"uses": shared_workflow.uses, "secrets": "inherit"}
+        needs = [name for name in shared_workflow.needs if name in jobs]
+        if needs:
+            calling_job = {"needs": needs, **calling_job}
+        jobs.setdefault(shared_workflow.job_id, calling_job)
+        for name in shared_workflow.needed_by:
+            job = jobs.get(name)
+            if not isinstance(job, dict):
+                continue
+            needed = job.get("needs") or []
+            needed = [needed] if isinstance(needed, str) else list(needed)
+            if shared_workflow.job_id not in needed:
+                job["needs"] = needed + [shared_workflow.job_id]
+    return dump_yaml(workflow)
+
+def shared_workflow_name(path: str, taken: set[str]) -> str:
+    """A unique, GitHub-friendly workflow file name (without `.yml`) for an included file"""
+    name = job_id(os.path.splitext(os.path.basename(path))[0])
+    unique = name
+    suffix = 2
+    while unique in taken:
+        unique = f"{name}-{suffix}"
+        suffix += 1
+    return unique
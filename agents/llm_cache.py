@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('gl2gh')
+
+class LLMCache:
+    """
+    An on-disk cache of LLM responses.
+
+    Entries are keyed by a hash of (provider, model, rendered prompt) so re-running a conversion with the
+    same inputs (eg, after a crash, or with a different --max-attempts) doesn't pay for identical calls again.
+    Each entry is a small JSON file.  Entries expire `max_age_days` after they were written, however often they're used
+    (so prompt or model changes eventually get fresh responses), and when the cache grows past `max_size_mb` the least
+    recently used entries are removed.  Eviction scans the whole directory, so it runs at most
+    once every `evict_interval` seconds per cache directory, however many caches (eg, batch or server workers) share it.
+    """
+
+    # when each cache directory was last evicted, shared by every LLMCache in the process
+    last_evicted = {}
+    evict_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str = ".gl2gh_cache/llm", max_age_days: float = 30, max_size_mb: float = 200,
+                 evict_interval: float = 60):
+        self.cache_dir = cache_dir
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.max_size = max_size_mb * 1024 * 1024
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, provider: str, model: str, prompt: str, variant: int = 0) -> str:
+        # `variant` lets callers ask for several independent responses to the same prompt
+        payload = json.dumps([provider, model, prompt, variant] if variant else [provider, model, prompt])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> str | None:
+        path = self.path_for(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            if time.time() - entry.get("created", 0) > self.max_age:
+                self.remove(path)
+                raise FileNotFoundError(path)
+            # touch the file so eviction is least-recently-used rather than oldest-written - the age limit uses the
+            # time it was written, which is in the entry itself
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        logger.debug(f"LLM cache hit for {key}")
+        return entry["response"]
+
+    def set(self, key: str, response: str, cost: float = 0.0):
+        path = self.path_for(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"response": response, "cost": cost, "created": time.time()}, f)
+        os.replace(temp_path, path)
+        self.maybe_evict()
+
+    def maybe_evict(self):
+        """Evict if nothing has evicted this cache directory in the last `evict_interval` seconds"""
+        directory = os.path.abspath(self.cache_dir)
+        now = time.time()
+        with LLMCache.evict_lock:
+            if now - LLMCache.last_evicted.get(directory, 0) < self.evict_interval:
+                return
+            LLMCache.last_evicted[directory] = now
+        self.evict()
+
+    def evict(self):
+        """Remove expired entries, then the least recently used ones until the cache fits in max_size"""
+        entries = []
+        now = time.time()
+        with self.lock:
+            try:
+                scanned = list(os.scandir(self.cache_dir))
+            except FileNotFoundError:
+                return
+            for entry in scanned:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                # an entry unused for max_age was also written more than max_age ago - ones still in use but past
+                # their age are removed when they're next read
+                if now - stat.st_mtime > self.max_age:
+                    self.remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                self.remove(path)
+                total_size -= size
+
+    def remove(self, path: str):
+        # another process (or another cache on the same directory) may have removed it already
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses"
@@ -0,0 +1,81 @@
+import re
+from agents.base_agent import BaseAgent
+
+class PatchError(ValueError):
+    """Raised when a patch from the LLM can't be applied to the workflow"""
+
+class PatchAgent(BaseAgent):
+    """
+    Asks the LLM for a unified diff against the previous implementation rather than a whole new workflow,
+    then applies it locally.  Hunks are located by their content (the line numbers LLMs write are rarely
+    accurate), so they only need to match the lines they change and their context.
+    """
+    prompt_file: str = "patch_repair.md"
+    system_prompt_file: str = "conversion_context.md"
+    hunk_header_re = re.compile(r'^@@\s*-(\d+)(?:,\d+)?\s+\+\d+(?:,\d+)?\s*@@')
+
+    def apply(self, original: str, diff: str) -> str:
+        lines = original.splitlines()
+        hunks = self.parse_hunks(diff)
+        if not hunks:
+            raise PatchError("no hunks found in the patch")
+
+        # apply from the bottom up so earlier hunks don't shift the positions of later ones
+        located = sorted(((self.locate(lines, hunk), hunk) for hunk in hunks), key=lambda item: item[0])
+        for ((start, length), hunk), ((next_start, _), _) in zip(located, located[1:]):
+            # a repeated hunk, or two which change (or insert at) the same lines, can't both be applied
+            if next_start < start + length or next_start == start:
+                raise PatchError(f"the hunk at line {hunk['line']} overlaps another one at line {next_start + 1}")
+        for (start, length), hunk in reversed(located):
+            lines[start:start + length] = hunk["new"]
+        return "\n".join(lines) + "\n"
+
+    def parse_hunks(self, diff: str) -> list[dict]:
+        diff = diff.replace("```diff", "").replace("```", "")
+        hunks = []
+        hunk = None
+        for line in diff.splitlines():
+            header = self.hunk_header_re.match(line)
+            if header:
+                hunk = {"line": int(header.group(1)), "old": [], "new": []}
+                hunks.append(hunk)
+                continue
+            if hunk is None or line.startswith("\\"):
+                # file headers before the first hunk, or "\ No newline at end of file"
+                continue
+            if line.startswith("--- ") or line.startswith("+++ "):
+                hunk = None
+                continue
+            if line.startswith("-"):
+                hunk["old"].append(line[1:])
+            elif line.startswith("+"):
+                hunk["new"].append(line[1:])
+            else:
+                # context - LLMs often drop the leading space on blank lines
+                hunk["old"].append(line[1:] if line.startswith(" ") else line)
+                hunk["new"].append(line[1:] if line.startswith(" ") else line)
+
+        for hunk in hunks:
+            # trailing blank "context" is usually just the gap before the next hunk or the end of the reply
+            while hunk["old"] and hunk["new"] and hunk["old"][-1] == "" and hunk["new"][-1] == "":
+                hunk["old"].pop()
+                hunk["new"].pop()
+        return [hunk for hunk in hunks if hunk["old"] != hunk["new"]]
+
+    def locate(self, lines: list[str], hunk: dict) -> tuple[int, int]:
+        """Returns the (start, length) of the lines the hunk replaces, preferring the match nearest its header"""
+        old = hunk["old"]
+        hint = max(hunk["line"] - 1, 0)
+        if not old:
+            return min(hint, len(lines)), 0
+
+        for normalise in (lambda line: line, lambda line: line.rstrip()):
+            target = [normalise(line) for line in old]
+            matches = [
+                start for start in range(len(lines) - len(old) + 1)
+                if [normalise(line) for line in lines[start:start + len(old)]] == target
+            ]
+            if matches:
+                return min(matches, key=lambda start: abs(start - hint)), len(old)
+
+        raise PatchError(f"couldn't find the lines for the hunk at line {hunk['line']}: {old[0]!r}")
@@ -0,0 +1,162 @@
+import copy
+import re
+import yaml
+from agents.yaml_utils import WorkflowDumper, dump_yaml
+
+# top-level keys which aren't jobs
+GLOBAL_KEYWORDS = ["stages", "variables", "workflow", "include", "default", "image", "services", "before_script", "after_script", "cache"]
+# keys a job picks up from `default:` (or the equivalent deprecated top-level keys) unless it sets them itself
+DEFAULT_KEYWORDS = ["image", "services", "before_script", "after_script", "cache", "artifacts", "retry", "timeout", "interruptible", "tags", "hooks", "id_tokens"]
+SCRIPT_KEYWORDS = ["script", "before_script", "after_script"]
+DEFAULT_STAGES = [".pre", "build", "test", "deploy", ".post"]
+
+class Reference(list):
+    """The value of a GitLab `!reference [job, key, ...]` tag"""
+
+class GitLabLoader(yaml.SafeLoader):
+    """A SafeLoader which understands GitLab's `!reference` tag (anchors and `<<` merge keys are handled by YAML itself)"""
+
+GitLabLoader.add_constructor("!reference", lambda loader, node: Reference(loader.construct_sequence(node)))
+# so pipelines can be written back out (eg, with their includes merged in) without losing their `!reference` tags
+WorkflowDumper.add_representer(Reference, lambda dumper, data: dumper.represent_sequence("!reference", data, flow_style=True))
+
+class GitLabPipeline:
+    """
+    A parsed GitLab CI pipeline, with `extends`, `!reference` tags and `default:` resolved so each job stands on its own.
+    """
+
+    def __init__(self, gitlab_yaml: str):
+        raw = yaml.load(gitlab_yaml, Loader=GitLabLoader) or {}
+        if not isinstance(raw, dict):
+            raise ValueError("GitLab CI file is not a YAML mapping")
+        self.raw = raw
+        self.global_context = {key: raw[key] for key in GLOBAL_KEYWORDS if key in raw}
+        self.templates = {name: body for name, body in raw.items() if isinstance(name, str) and name.startswith(".")}
+        self.stages = raw.get("stages") or DEFAULT_STAGES
+        self.jobs = {}
+        for name, body in raw.items():
+            if name in GLOBAL_KEYWORDS or not isinstance(body, dict) or str(name).startswith("."):
+                continue
+            self.jobs[str(name)] = self.resolve_job(str(name))
+
+    def resolve_extends(self, name: str, seen: tuple = ()) -> dict:
+        """Returns the job (or template) with everything it `extends` deep-merged underneath it"""
+        if name in seen:
+            raise ValueError(f"circular extends involving {name}")
+        body = self.raw.get(name)
+        if not isinstance(body, dict):
+            raise ValueError(f"unknown job or template {name!r} in extends")
+        extends = body.get("extends", [])
+        if isinstance(extends, str):
+            extends = [extends]
+
+        resolved = {}
+        for parent in extends:
+            resolved = deep_merge(resolved, self.resolve_extends(parent, seen + (name,)))
+        resolved = deep_merge(resolved, {key: value for key, value in body.items() if key != "extends"})
+        return resolved
+
+    def resolve_job(self, name: str) -> dict:
+        job = self.resolve_extends(name)
+
+        defaults = dict(self.raw.get("default") or {})
+        # the deprecated top-level equivalents of default:
+        for key in DEFAULT_KEYWORDS:
+            if key in self.raw and key not in defaults:
+                defaults[key] = self.raw[key]
+        inherit = (job.get("inherit") or {}).get("default", True)
+        for key, value in defaults.items():
+            if inherit is False or (isinstance(inherit, list) and key not in inherit):
+                continue
+            job.setdefault(key, copy.deepcopy(value))
+
+        job = self.resolve_references(job)
+        for key in SCRIPT_KEYWORDS:
+            if isinstance(job.get(key), list):
+                job[key] = flatten(job[key])
+        return job
+
+    def resolve_references(self, value, depth: int = 0):
+        if depth > 10:
+            raise ValueError("!reference tags nested too deeply")
+        if isinstance(value, Reference):
+            target = self.resolve_extends(value[0]) if value and value[0] in self.raw else None
+            for key in value[1:]:
+                target = target.get(key) if isinstance(target, dict) else None
+            if target is None:
+                # leave anything we can't resolve for the LLM to make sense of
+                return list(value)
+            return self.resolve_references(copy.deepcopy(target), depth + 1)
+        if isinstance(value, dict):
+            return {key: self.resolve_references(item, depth) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.resolve_references(item, depth) for item in value]
+        return value
+
+    def job_stage(self, name: str) -> str:
+        return str(self.jobs[name].get("stage", "test"))
+
+    def stage_index(self, stage: str) -> int:
+        return self.stages.index(stage) if stage in self.stages else len(self.stages)
+
+    def job_groups(self, max_jobs: int = 10) -> list[list[str]]:
+        """Split the jobs into groups of at most `max_jobs`, keeping jobs from the same stage together where possible"""
+        by_stage = {}
+        for name in self.jobs:
+            by_stage.setdefault(self.job_stage(name), []).append(name)
+
+        groups = []
+        for stage in sorted(by_stage, key=self.stage_index):
+            names = by_stage[stage]
+            for start in range(0, len(names), max_jobs):
+                groups.append(names[start:start + max_jobs])
+        return groups
+
+    def job_ids(self) -> dict[str, str]:
+        """Maps each GitLab job name to a unique GitHub Actions job id"""
+        ids = {}
+        for name in self.jobs:
+            candidate = job_id(name)
+            unique = candidate
+            suffix = 2
+            while unique in ids.values():
+                unique = f"{candidate}-{suffix}"
+                suffix += 1
+            ids[name] = unique
+        return ids
+
+    def context_yaml(self) -> str:
+        """The pipeline-wide settings every job shares (stages, variables, workflow rules, ...)"""
+        context = {key: value for key, value in self.global_context.items() if key not in DEFAULT_KEYWORDS and key != "default"}
+        context["stages"] = self.stages
+        return dump_yaml(context)
+
+    def jobs_yaml(self, names: list[str]) -> str:
+        return dump_yaml({name: self.jobs[name] for name in names})
+
+def job_id(name: str) -> str:
+    """The GitHub Actions job id to use for a GitLab job name"""
+    slug = re.sub(r"[^a-z0-9_-]+", "-", name.lower()).strip("-")
+    if not slug or not re.match(r"[a-z_]", slug):
+        slug = f"job-{slug}"
+    return slug
+
+def deep_merge(base: dict, override: dict) -> dict:
+    """Merge the way GitLab's `extends` does - hashes are merged recursively, everything else is replaced"""
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+def flatten(items: list) -> list:
+    """GitLab flattens nested script arrays (eg, from `!reference`) into a single list of commands"""
+    flat = []
+    for item in items:
+        if isinstance(item, list):
+            flat.extend(flatten(item))
+        else:
+            flat.append(item)
+    return flat
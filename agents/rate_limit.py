@@ -0,0 +1,204 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger('gl2gh')
+
+# HTTP statuses worth trying again - timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+# exception class names (from litellm, openai, httpx and requests) which mean "try again later"
+RETRYABLE_ERRORS = {
+    "RateLimitError", "Timeout", "APITimeoutError", "APIConnectionError", "ServiceUnavailableError",
+    "InternalServerError", "ConnectionError", "ConnectTimeout", "ReadTimeout", "TimeoutError", "CircuitOpenError",
+}
+
+class CircuitOpenError(Exception):
+    """Calls to a service are being held back because it has been failing"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} has been failing - holding off for {retry_in:.0f}s")
+        self.retry_after = retry_in
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at `per_minute` tokens a minute (holding at most a minute's worth).
+    `acquire` blocks until there are enough tokens.  A rate of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute: float = 0):
+        self.lock = threading.Lock()
+        self.set_rate(per_minute)
+
+    def set_rate(self, per_minute: float):
+        with self.lock:
+            self.per_minute = per_minute
+            self.tokens = per_minute
+            self.updated = time.monotonic()
+
+    def acquire(self, amount: float = 1):
+        while True:
+            with self.lock:
+                if not self.per_minute:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.per_minute / 60)
+                self.updated = now
+                # a single request bigger than the whole bucket just has to wait for a full bucket
+                amount = min(amount, self.per_minute)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) * 60 / self.per_minute
+            time.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Stops calls to a service after `failure_threshold` failures in a row, for `reset_after` seconds.  After that a
+    single trial call is let through - if it succeeds the circuit closes again, otherwise it stays open for another period.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_after: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """Raises CircuitOpenError if calls are paused - returns True if this call is the trial one"""
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.reset_after - time.monotonic()
+            if remaining > 0 or self.trial_running:
+                raise CircuitOpenError(self.name, max(remaining, 1))
+            self.trial_running = True
+            return True
+
+    def end_trial(self):
+        """The trial call ended without telling us whether the service is back - let the next call try instead"""
+        with self.lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"{self.name} has failed {self.failures} times in a row - pausing calls for {self.reset_after}s")
+                self.opened_at = time.monotonic()
+
+class RateLimiter:
+    """
+    Everything between us and one service (an LLM provider, or a documentation host): a requests-per-minute bucket,
+    a tokens-per-minute bucket, a circuit breaker, and retries with jittered exponential backoff.
+
+    `call` runs a function under all of those, retrying errors which look temporary (rate limits, timeouts, server
+    errors) up to `max_retries` times.  A `Retry-After` header on the error is honoured when there is one.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_retries: int = 5,
+                 base_delay: float = 1, max_delay: float = 60):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(name)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def configure(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_retries: int | None = None):
+        if requests_per_minute != self.requests.per_minute:
+            self.requests.set_rate(requests_per_minute)
+        if tokens_per_minute != self.tokens.per_minute:
+            self.tokens.set_rate(tokens_per_minute)
+        if max_retries is not None:
+            self.max_retries = max_retries
+
+    def call(self, function, tokens: int = 0):
+        for attempt in range(self.max_retries + 1):
+            trial = False
+            try:
+                trial = self.breaker.before_call()
+                self.requests.acquire()
+                self.tokens.acquire(tokens)
+                result = function()
+            except BaseException as e:
+                if not isinstance(e, Exception) or not is_retryable(e):
+                    # eg, a bad request - not a sign the service is down, but it mustn't leave the trial running
+                    if trial:
+                        self.breaker.end_trial()
+                    raise
+                if not isinstance(e, CircuitOpenError):
+                    self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+                self.retries += 1
+                logger.warning(f"{self.name}: {e.__class__.__name__} ({e}) - retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """The server's Retry-After if it gave one, otherwise "full jitter" exponential backoff"""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+def get_limiter(name: str, max_retries: int = 5) -> RateLimiter:
+    """The process-wide limiter for a provider or host - shared by every agent (and every converter in a batch)"""
+    with limiters_lock:
+        if name not in limiters:
+            limiters[name] = RateLimiter(name, max_retries=max_retries)
+        return limiters[name]
+
+def is_retryable(error: Exception) -> bool:
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+def get_status_code(error: Exception) -> int | None:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def get_retry_after(error: Exception) -> float | None:
+    """The delay asked for by a `Retry-After` header (in seconds or as an HTTP date) on the error's response, if any"""
+    retry_after = getattr(error, "retry_after", None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "litellm_response_headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+    except AttributeError:
+        return None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,105 @@
+import logging
+import yaml
+from agents.pipeline import GitLabPipeline
+
+logger = logging.getLogger('gl2gh')
+
+# complexity scores at which a pipeline starts on the second, third, ... tier
+TIER_THRESHOLDS = [15, 40]
+
+class ModelRouter:
+    """
+    Picks the implementation model for each attempt from a list of tiers, cheapest/fastest first.
+
+    A pipeline starts on a tier chosen from its complexity score (see `complexity`), so trivial pipelines use the
+    small model and big ones skip straight to a stronger one.  After `escalate_after` failed attempts on a tier
+    (actionlint errors persist, or the quality check fails) the next attempt moves up a tier.
+
+    The attempts and cost spent on each tier are kept for the final report.
+    """
+
+    def __init__(self, tiers: list[str], escalate_after: int = 1, thresholds: list[int] = TIER_THRESHOLDS):
+        if not tiers:
+            raise ValueError("at least one model tier is needed")
+        self.tiers = tiers
+        self.escalate_after = max(1, escalate_after)
+        self.thresholds = thresholds
+        self.tier = 0
+        self.failures = 0
+        self.score = None
+        self.tier_stats = [{"model": model, "attempts": 0, "passed": 0, "cost": 0.0} for model in tiers]
+
+    @property
+    def model(self) -> str:
+        return self.tiers[self.tier]
+
+    def start(self, gitlab_yaml: str) -> str:
+        """Score the pipeline and choose the tier to start on - returns its model"""
+        self.score = complexity(gitlab_yaml)
+        if self.score is None:
+            logger.debug("Could not score the pipeline's complexity")
+            start = 1
+        else:
+            start = sum(1 for threshold in self.thresholds if self.score >= threshold)
+        self.tier = min(start, len(self.tiers) - 1)
+        logger.info(f"Pipeline complexity {self.score} - starting with {self.model} (tier {self.tier + 1} of {len(self.tiers)})")
+        return self.model
+
+    def record_attempt(self, passed: bool, cost: float):
+        """Record the outcome of an attempt on the current tier, escalating if it has failed too often"""
+        stats = self.tier_stats[self.tier]
+        stats["attempts"] += 1
+        stats["cost"] += cost
+        if passed:
+            stats["passed"] += 1
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= self.escalate_after and self.tier < len(self.tiers) - 1:
+            self.tier += 1
+            self.failures = 0
+            logger.info(f"Escalating to {self.model} (tier {self.tier + 1} of {len(self.tiers)})")
+
+    def stats(self) -> list[dict]:
+        return [{**stats, "tier": tier + 1} for tier, stats in enumerate(self.tier_stats)]
+
+    def state(self) -> dict:
+        """Everything needed to pick up where we left off (for resuming a run)"""
+        return {"tier": self.tier, "failures": self.failures, "score": self.score, "tier_stats": self.tier_stats}
+
+    def restore(self, state: dict) -> bool:
+        """Pick up from a saved `state()` - returns False (leaving the router as it is) if the tiers have changed since"""
+        if [stats["model"] for stats in state["tier_stats"]] != self.tiers:
+            logger.info("Model tiers have changed since the run was saved - choosing the starting tier afresh")
+            return False
+        self.tier = state["tier"]
+        self.failures = state["failures"]
+        self.score = state["score"]
+        self.tier_stats = state["tier_stats"]
+        return True
+
+def complexity(gitlab_yaml: str) -> int | None:
+    """
+    A rough score of how hard a pipeline is to convert - one point per job, plus extra for the features that tend to
+    need a more capable model (includes, rules, services, needs, templates, matrices, triggers, ...).
+    Returns None if the pipeline can't be parsed.
+    """
+    try:
+        pipeline = GitLabPipeline(gitlab_yaml)
+    except (ValueError, yaml.YAMLError):
+        return None
+
+    includes = pipeline.raw.get("include") or []
+    score = len(pipeline.jobs)
+    score += 3 * (len(includes) if isinstance(includes, list) else 1)
+    score += 2 * len(pipeline.templates)
+    score += 3 if pipeline.raw.get("workflow") else 0
+    for job in pipeline.jobs.values():
+        score += len(job.get("rules") or [])
+        score += 2 * len(job.get("services") or [])
+        score += 1 if job.get("needs") else 0
+        score += 2 if job.get("parallel") else 0
+        score += 3 if job.get("trigger") else 0
+        score += 2 if job.get("environment") else 0
+        score += 1 if job.get("artifacts") or job.get("cache") else 0
+    return score
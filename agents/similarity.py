@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import yaml
+from agents.pipeline import GitLabPipeline
+
+logger = logging.getLogger('gl2gh')
+
+NUM_PERMUTATIONS = 64
+MERSENNE_PRIME = (1 << 61) - 1
+# fixed, so signatures stay comparable between runs
+_rng = random.Random(20240601)
+PERMUTATIONS = [(_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+# how much of the similarity comes from variables having the same values, rather than the pipeline's shape
+VALUE_WEIGHT = 0.1
+
+class SimilarityIndex:
+    """
+    Previously converted pipelines, so a new pipeline which is nearly the same as one we've already done (a different
+    image tag, variable values, project name, ...) can start from that conversion rather than from nothing.
+
+    Each pipeline is reduced to a set of structural features (see `features`) and a MinHash signature of them, which
+    estimates how much two pipelines' features overlap.  Whether their variables have the same values counts for a
+    little too (see `VALUE_WEIGHT`).  Entries are small JSON files in `directory`, one per pipeline, read the first
+    time the index is searched.
+    """
+
+    def __init__(self, directory: str, threshold: float = 0.85):
+        self.directory = directory
+        self.threshold = threshold
+        self.loaded = None
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def find(self, gitlab_yaml: str) -> dict | None:
+        """The most similar previous conversion at or above the threshold (with its `similarity`), or None"""
+        profile = pipeline_profile(gitlab_yaml)
+        if profile is None:
+            return None
+        best = None
+        for entry in self.entries():
+            score = (1 - VALUE_WEIGHT) * similarity(profile["signature"], entry["signature"])
+            score += VALUE_WEIGHT * value_similarity(profile["values"], entry.get("values", {}))
+            if score >= self.threshold and (best is None or score > best["similarity"]):
+                best = {**entry, "similarity": score}
+        return best
+
+    def add(self, gitlab_yaml: str, workflow: str, attempts: int):
+        profile = pipeline_profile(gitlab_yaml)
+        if profile is None:
+            return
+        key = hashlib.sha256(gitlab_yaml.encode("utf-8")).hexdigest()
+        entry = {"key": key, **profile, "workflow": workflow, "attempts": attempts, "created": time.time()}
+        path = os.path.join(self.directory, f"{key}.json")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+        with self.lock:
+            if self.loaded is not None:
+                self.loaded = [other for other in self.loaded if other.get("key") != key] + [entry]
+        logger.debug(f"Added the conversion to the similarity index as {key}")
+
+    def entries(self) -> list[dict]:
+        with self.lock:
+            if self.loaded is None:
+                self.loaded = self.load()
+            return list(self.loaded)
+
+    def load(self) -> list[dict]:
+        entries = []
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), "r") as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+def pipeline_profile(gitlab_yaml: str) -> dict | None:
+    """The pipeline's MinHash `signature` and its variables' `values`, or None if it can't be parsed"""
+    try:
+        pipeline = GitLabPipeline(gitlab_yaml)
+    except (ValueError, yaml.YAMLError):
+        return None
+    return {"signature": minhash(features(pipeline)), "values": variable_values(pipeline)}
+
+def features(pipeline: GitLabPipeline) -> set[str]:
+    """
+    The pipeline's shape: the stages, the global settings and variable names, and for each job its stage, the keys it
+    sets, its variable names, its images (without tags) and three-word shingles of its script commands (with numbers
+    and quoted strings blanked out).  Job names aren't used, as they often include the project's name, and nor are
+    variable values - those are compared separately (see `value_similarity`).
+
+    When a pipeline runs - its workflow rules, each job's `rules`/`only`/`except` (branches, tags, conditions) - is
+    included as written, so pipelines which run at different times don't look alike.
+    """
+    found = {f"stages:{','.join(map(str, pipeline.stages))}"}
+    found.update(f"global:{key}" for key in pipeline.global_context)
+    found.update(variables("variable", pipeline.raw.get("variables")))
+    workflow = pipeline.raw.get("workflow")
+    found.update(conditions("workflow", workflow.get("rules") if isinstance(workflow, dict) else None))
+    for job in pipeline.jobs.values():
+        stage = str(job.get("stage", "test"))
+        found.update(f"{stage}:key:{path}" for path in key_paths(job))
+        found.update(variables(f"{stage}:variable", job.get("variables")))
+        for key in ("rules", "only", "except"):
+            found.update(conditions(f"{stage}:{key}", job.get(key)))
+        for image in images(job):
+            found.add(f"{stage}:image:{image}")
+        for key in ("before_script", "script", "after_script"):
+            words = []
+            for command in job.get(key) or []:
+                words.extend(normalise_command(str(command)).split())
+            found.update(f"{stage}:{key}:{' '.join(words[i:i + 3])}" for i in range(max(1, len(words) - 2)) if words)
+    return found
+
+def variables(prefix: str, values) -> set[str]:
+    """A feature for each variable's name"""
+    if not isinstance(values, dict):
+        return set()
+    return {f"{prefix}:{name}" for name in values}
+
+def variable_values(pipeline: GitLabPipeline) -> dict[str, str]:
+    """Every variable's value, keyed on where it's set and its name"""
+    scopes = [("", pipeline.raw.get("variables"))]
+    scopes += [(f"{job.get('stage', 'test')}:", job.get("variables")) for job in pipeline.jobs.values()]
+    found = {}
+    for scope, values in scopes:
+        if isinstance(values, dict):
+            found.update((f"{scope}{name}", json.dumps(value, sort_keys=True, default=str)) for name, value in values.items())
+    return found
+
+def value_similarity(first: dict[str, str], second: dict[str, str]) -> float:
+    """The fraction of the variables set in both pipelines which have the same value in each"""
+    shared = set(first) & set(second)
+    if not shared:
+        return 1.0
+    return sum(1 for name in shared if first[name] == second[name]) / len(shared)
+
+def conditions(prefix: str, value) -> set[str]:
+    """A feature for each rule (or `only`/`except` ref) exactly as written - these decide when the job runs"""
+    if value is None:
+        return set()
+    items = value if isinstance(value, list) else [value]
+    return {f"{prefix}:{json.dumps(item, sort_keys=True, default=str)}" for item in items}
+
+def key_paths(value, prefix: str = "", depth: int = 0) -> list[str]:
+    """The (nested) keys a job sets, eg `artifacts.paths` - but not the names of its variables"""
+    if not isinstance(value, dict) or depth > 2:
+        return []
+    paths = []
+    for key, item in value.items():
+        path = f"{prefix}{key}"
+        paths.append(path)
+        if key != "variables":
+            paths.extend(key_paths(item, f"{path}.", depth + 1))
+    return paths
+
+def images(job: dict) -> list[str]:
+    found = []
+    for image in [job.get("image")] + list(job.get("services") or []):
+        if isinstance(image, dict):
+            image = image.get("name")
+        if isinstance(image, str):
+            # drop the tag/digest - lookalike pipelines often differ only in the version they use
+            found.append(re.split(r"[:@]", image.rsplit("/", 1)[-1])[0])
+    return found
+
+def normalise_command(command: str) -> str:
+    command = re.sub(r"\"[^\"]*\"|'[^']*'", "STR", command.lower())
+    return re.sub(r"\d+(?:\.\d+)*", "N", command)
+
+def minhash(found: set[str]) -> list[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big") for feature in found]
+    if not hashes:
+        return [MERSENNE_PRIME] * NUM_PERMUTATIONS
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in PERMUTATIONS]
+
+def similarity(first: list[int], second: list[int]) -> float:
+    """The estimated Jaccard similarity of the features behind two signatures"""
+    if len(first) != len(second):
+        return 0.0
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
@@ -0,0 +1,96 @@
+import re
+import yaml
+from agents.yaml_utils import WorkflowLoader
+
+OPENING_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*[ \t]*\n", re.MULTILINE)
+# a document marker, comment, list item or `key:` - the first line of anything that could be a workflow
+YAML_LINE_RE = re.compile(r"""^\s*(?:---|#|-(?:\s|$)|[\w.$/-]+:(?:\s|$)|"[^"]+":(?:\s|$)|'[^']+':(?:\s|$))""")
+
+class StreamAborted(Exception):
+    """The streamed output was abandoned part way through because it was clearly unusable"""
+
+    def __init__(self, reason: str, partial: str):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial = partial
+
+class StreamMonitor:
+    """
+    Watches a workflow being streamed from the LLM, so a hopeless response can be abandoned early rather than
+    paid for (and waited on) in full.
+
+    `feed` is called with each new piece of text.  It raises `StreamAborted` if the output clearly isn't going to be
+    a usable workflow - it starts with prose rather than YAML, or it has a YAML syntax error well before the end
+    (errors right at the end are usually just where the text has been cut off so far) - and returns True once the
+    workflow is complete (the model has closed its ```yaml fence), so there's no need to read any trailing prose.
+    Any preamble before the opening fence is dropped.
+
+    If `output_filename` is given the workflow is written there as it arrives.  With `abort=False` the output is
+    never abandoned (for the last try, when a flawed workflow is better than none).
+    """
+
+    def __init__(self, output_filename: str | None = None, abort: bool = True, check_every: int = 400, prose_limit: int = 200,
+                 grace_lines: int = 3):
+        self.output_filename = output_filename
+        self.abort = abort
+        self.check_every = check_every
+        self.prose_limit = prose_limit
+        self.grace_lines = grace_lines
+        self.text = ""
+        self.checked_length = 0
+        self.complete = False
+
+    def feed(self, chunk: str) -> bool:
+        self.text += chunk
+        body, self.complete = self.workflow_text()
+        if self.complete or len(self.text) - self.checked_length >= self.check_every:
+            self.checked_length = len(self.text)
+            self.write(body)
+            if self.abort:
+                self.check(body)
+        return self.complete
+
+    def result(self) -> str:
+        """The workflow so far (without any fences or trailing prose)"""
+        body, _ = self.workflow_text()
+        self.write(body)
+        return body
+
+    def workflow_text(self) -> tuple[str, bool]:
+        """The text of the workflow, and whether its closing fence has arrived"""
+        # anything before an opening fence is the model talking to itself - the workflow starts after it
+        opening = OPENING_FENCE_RE.search(self.text)
+        if not opening:
+            return self.text, False
+        body = self.text[opening.end():]
+        closing = body.find("```")
+        if closing == -1:
+            return body, False
+        return body[:closing], True
+
+    def check(self, body: str):
+        lines = [line for line in body.splitlines() if line.strip()]
+        if not lines:
+            if len(self.text) > self.prose_limit:
+                raise StreamAborted("no YAML in the output", self.text)
+            return
+        if not YAML_LINE_RE.match(lines[0]) and len(body) > self.prose_limit:
+            raise StreamAborted(f"output starts with prose rather than YAML: {lines[0][:80]!r}", self.text)
+
+        # the last line may not have finished arriving yet
+        complete_lines = body.splitlines() if self.complete else body.splitlines()[:-1]
+        try:
+            data = yaml.load("\n".join(complete_lines), Loader=WorkflowLoader)
+        except yaml.YAMLError as e:
+            mark = getattr(e, "problem_mark", None)
+            if mark is not None and mark.line < len(complete_lines) - self.grace_lines:
+                raise StreamAborted(f"invalid YAML at line {mark.line + 1}: {getattr(e, 'problem', e)}", self.text)
+            return
+        if data is not None and not isinstance(data, dict):
+            raise StreamAborted("output is not a YAML mapping", self.text)
+
+    def write(self, body: str):
+        if not self.output_filename:
+            return
+        with open(self.output_filename, "w") as f:
+            f.write(body)
@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import requests
+
+logger = logging.getLogger('gl2gh')
+
+@dataclass
+class Span:
+    """One timed piece of work - an LLM call, an actionlint run, a docs fetch, ..."""
+    name: str
+    stage: str
+    span_id: str
+    start: float
+    end: float = 0.0
+    attempt: int = 0
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "stage": self.stage,
+            "span_id": self.span_id,
+            "attempt": self.attempt,
+            "start": self.start,
+            "duration": round(self.duration, 4),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class Tracer:
+    """
+    Collects spans for one conversion so we can see where the time (and tokens, and money) goes.
+
+    Spans are recorded from several threads at once.  `attempt` is set by the converter as it goes, and each span
+    records the attempt it started in.
+    """
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.root_span_id = os.urandom(8).hex()
+        self.start = time.time()
+        self.attempt = 0
+        self.spans = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, stage: str | None = None, **attributes):
+        span = Span(name=name, stage=stage or name, span_id=os.urandom(8).hex(), start=time.time(),
+                    attempt=self.attempt, attributes=attributes)
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            span.end = time.time()
+            with self.lock:
+                self.spans.append(span)
+
+    def stages(self) -> dict:
+        """Totals for each stage - calls, seconds, tokens (including those read from the provider's prompt cache), cost and cache hits"""
+        stages = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = stages.setdefault(span.stage, {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                   "cached_tokens": 0, "cost": 0.0, "cache_hits": 0, "errors": 0})
+            stage["calls"] += 1
+            stage["seconds"] += span.duration
+            stage["prompt_tokens"] += span.attributes.get("prompt_tokens", 0)
+            stage["completion_tokens"] += span.attributes.get("completion_tokens", 0)
+            stage["cached_tokens"] += span.attributes.get("cached_tokens", 0)
+            stage["cost"] += span.attributes.get("cost", 0.0)
+            stage["cache_hits"] += 1 if span.attributes.get("cache_hit") else 0
+            stage["errors"] += 1 if span.error else 0
+        for stage in stages.values():
+            stage["seconds"] = round(stage["seconds"], 4)
+        return stages
+
+    def report(self, summary: dict | None = None) -> dict:
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.start,
+            "duration": round(time.time() - self.start, 4),
+            "summary": summary or {},
+            "stages": self.stages(),
+            "spans": [span.to_dict() for span in spans],
+        }
+
+    def write_report(self, filename: str, summary: dict | None = None) -> str:
+        with open(filename, "w") as f:
+            json.dump(self.report(summary), f, indent=2, default=str)
+        logger.info(f"Run report written to {filename}")
+        return filename
+
+class OTLPExporter:
+    """
+    Sends a tracer's spans to an OpenTelemetry collector using OTLP over HTTP (JSON encoding), eg
+    `http://localhost:4318`.  Export failures are logged rather than raised - telemetry should never break a conversion.
+    """
+
+    def __init__(self, endpoint: str, service_name: str = "gl2gh", timeout: float = 5):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def export(self, tracer: Tracer, attributes: dict | None = None):
+        try:
+            response = requests.post(self.url, json=self.payload(tracer, attributes or {}), timeout=self.timeout)
+            response.raise_for_status()
+            logger.debug(f"Exported {len(tracer.spans)} spans to {self.url}")
+        except requests.RequestException as e:
+            logger.warning(f"Could not export telemetry to {self.url}: {e}")
+
+    def payload(self, tracer: Tracer, attributes: dict) -> dict:
+        with tracer.lock:
+            spans = list(tracer.spans)
+        root_end = max([span.end for span in spans] + [time.time()])
+        otlp_spans = [{
+            "traceId": tracer.trace_id,
+            "spanId": tracer.root_span_id,
+            "name": "conversion",
+            "kind": 1,
+            "startTimeUnixNano": str(int(tracer.start * 1e9)),
+            "endTimeUnixNano": str(int(root_end * 1e9)),
+            "attributes": otlp_attributes(attributes),
+        }]
+        for span in spans:
+            otlp_spans.append({
+                "traceId": tracer.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": tracer.root_span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(int(span.start * 1e9)),
+                "endTimeUnixNano": str(int(span.end * 1e9)),
+                "attributes": otlp_attributes({"gl2gh.stage": span.stage, "gl2gh.attempt": span.attempt, **span.attributes}),
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "gl2gh"}, "spans": otlp_spans}],
+        }]}
+
+def otlp_attributes(attributes: dict) -> list[dict]:
+    """Converts a dict to OTLP's list of typed key/value pairs"""
+    converted = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        converted.append({"key": key, "value": typed})
+    return converted
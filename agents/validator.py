@@ -1,14 +1,108 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field
 from subprocess import run
 import tempfile
+from agents.telemetry import Tracer
+
+STDIN_FILENAME = "<stdin>"
+
+@dataclass
+class LintError:
+    """A single error reported by actionlint"""
+    line: int
+    column: int
+    kind: str
+    message: str
+    url: str | None = None
+    filepath: str = STDIN_FILENAME
+
+    def __str__(self) -> str:
+        return f"{self.line}:{self.column}: {self.message} [{self.kind}]"
+
+@dataclass
+class ValidationResult:
+    passed: bool
+    errors: list[LintError] = field(default_factory=list)
+    stderr: str = ""
+
+    @property
+    def error_message(self) -> str:
+        """The errors formatted one per line, as `line:column: message [kind]`"""
+        return "\n".join(str(error) for error in self.errors)
 
 class ValidationAgent():
-    def run(self, github_actions_code: str) -> tuple[bool, str, str]:
-        # run 'actionlint' on the provided code
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        temp_file.write(github_actions_code.encode('utf-8'))
-        temp_file.flush()
-        # add the -shellcheck flag to the actionlint command
-        result = run(['actionlint', '-shellcheck=""', temp_file.name], capture_output=True, text=True)
-        temp_file.close()
-
-        return result.returncode == 0, result.stdout, result.stderr
+    """
+    Validates workflows with actionlint, using its JSON output rather than scraping the text format.
+
+    A single workflow is piped in via stdin.  Several workflows are written to a temporary directory
+    (which is cleaned up afterwards) and checked in one actionlint invocation.
+
+    `invocations` counts how many times actionlint has been run.
+    """
+    # an empty -shellcheck disables the shellcheck integration
+    command = ["actionlint", "-shellcheck=", "-format", "{{json .}}"]
+    url_pattern = re.compile(r'\bsee\s+(https?://[^\s"\'`]+)', re.IGNORECASE)
+
+    def __init__(self, tracer: Tracer | None = None):
+        self.invocations = 0
+        self.tracer = tracer or Tracer()
+
+    def run(self, github_actions_code: str) -> ValidationResult:
+        self.invocations += 1
+        with self.tracer.span("actionlint", workflows=1) as span:
+            result = run(self.command + ["-"], input=github_actions_code, capture_output=True, text=True)
+            errors = self.parse_errors(result.stdout)
+            span.set(errors=len(errors))
+        return self.make_result(result.returncode, errors, result.stderr)
+
+    def run_many(self, github_actions_code: list[str]) -> list[ValidationResult]:
+        if len(github_actions_code) == 1:
+            return [self.run(github_actions_code[0])]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = []
+            for i, code in enumerate(github_actions_code):
+                path = os.path.join(temp_dir, f"candidate_{i}.yml")
+                with open(path, "w") as f:
+                    f.write(code)
+                paths.append(path)
+            self.invocations += 1
+            with self.tracer.span("actionlint", workflows=len(paths)) as span:
+                result = run(self.command + paths, capture_output=True, text=True)
+                errors = self.parse_errors(result.stdout)
+                span.set(errors=len(errors))
+
+        results = []
+        for path in paths:
+            file_errors = [error for error in errors if os.path.basename(error.filepath) == os.path.basename(path)]
+            results.append(self.make_result(result.returncode, file_errors, result.stderr))
+        return results
+
+    def make_result(self, returncode: int, errors: list[LintError], stderr: str) -> ValidationResult:
+        # exit code 1 means "lint errors found" - anything else non-zero means actionlint itself failed
+        passed = returncode == 0 or (returncode == 1 and not errors)
+        if not passed and not errors and stderr.strip():
+            errors = [LintError(line=0, column=0, kind="actionlint", message=stderr.strip())]
+        return ValidationResult(passed=passed, errors=errors, stderr=stderr)
+
+    def parse_errors(self, stdout: str) -> list[LintError]:
+        try:
+            raw_errors = json.loads(stdout) if stdout.strip() else []
+        except ValueError:
+            return [LintError(line=0, column=0, kind="actionlint", message=stdout.strip())]
+
+        errors = []
+        for raw in raw_errors or []:
+            message = raw.get("message", "")
+            url_match = self.url_pattern.search(message)
+            errors.append(LintError(
+                line=raw.get("line", 0),
+                column=raw.get("column", 0),
+                kind=raw.get("kind", ""),
+                message=message,
+                url=url_match.group(1).rstrip(".,;:)") if url_match else None,
+                filepath=raw.get("filepath", STDIN_FILENAME),
+            ))
+        return errors
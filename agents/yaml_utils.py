@@ -0,0 +1,42 @@
+import re
+import yaml
+
+class WorkflowLoader(yaml.SafeLoader):
+    """A SafeLoader which leaves `on`/`off`/`yes`/`no` as strings (YAML 1.1 would turn GitHub's `on:` key into True)"""
+
+WorkflowLoader.yaml_implicit_resolvers = {
+    first: [(tag, regexp) for tag, regexp in resolvers if tag != "tag:yaml.org,2002:bool"]
+    for first, resolvers in yaml.SafeLoader.yaml_implicit_resolvers.items()
+}
+WorkflowLoader.add_implicit_resolver(
+    "tag:yaml.org,2002:bool", re.compile(r"^(?:true|True|TRUE|false|False|FALSE)$"), list("tTfF")
+)
+
+class WorkflowDumper(yaml.SafeDumper):
+    """A SafeDumper which writes multi-line strings (ie, shell scripts) as literal `|` blocks"""
+
+    def increase_indent(self, flow=False, indentless=False):
+        # indent lists inside mappings, the way GitHub's docs (and most people) write workflows
+        return super().increase_indent(flow, False)
+
+def represent_str(dumper: yaml.SafeDumper, data: str):
+    if "\n" in data:
+        return dumper.represent_scalar("tag:yaml.org,2002:str", data, style="|")
+    return dumper.represent_scalar("tag:yaml.org,2002:str", data)
+
+WorkflowDumper.add_representer(str, represent_str)
+# write `push:` rather than `push: null`
+WorkflowDumper.add_representer(type(None), lambda dumper, data: dumper.represent_scalar("tag:yaml.org,2002:null", ""))
+# use the same (YAML 1.2 style) booleans when deciding which strings need quoting, so `on:` is written unquoted
+WorkflowDumper.yaml_implicit_resolvers = WorkflowLoader.yaml_implicit_resolvers
+
+def load_workflow(text: str) -> dict:
+    """Parse a GitHub workflow, stripping any markdown code fences the LLM left in"""
+    text = text.replace("```yaml", "").replace("```", "")
+    data = yaml.load(text, Loader=WorkflowLoader)
+    if not isinstance(data, dict):
+        raise ValueError("workflow is not a YAML mapping")
+    return data
+
+def dump_yaml(data: dict) -> str:
+    return yaml.dump(data, Dumper=WorkflowDumper, sort_keys=False, default_flow_style=False, allow_unicode=True, width=1000)
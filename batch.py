@@ -0,0 +1,213 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from agents.docs_index import DEFAULT_INDEX_PATH
+from main import GitLabToGitHubConverter, setup_logging
+
+logger = logging.getLogger("gl2gh")
+
+
+def find_pipelines(source: str) -> tuple[list[str], str]:
+    """
+    Find the GitLab pipelines to convert.
+
+    `source` is either a directory (searched recursively for `.gitlab-ci.yml` / `*.gitlab-ci.yml` files)
+    or a manifest file listing one pipeline path per line (blank lines and `#` comments are ignored,
+    relative paths are relative to the manifest).
+
+    Returns the list of pipeline paths and the base directory used to name their output directories.
+    """
+    if os.path.isdir(source):
+        pipelines = []
+        for root, dirs, files in os.walk(source):
+            dirs[:] = sorted(d for d in dirs if d not in (".git", "node_modules"))
+            for filename in sorted(files):
+                if filename == ".gitlab-ci.yml" or filename.endswith(".gitlab-ci.yml"):
+                    pipelines.append(os.path.join(root, filename))
+        return pipelines, source
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    pipelines = []
+    with open(source, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            pipelines.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return pipelines, base_dir
+
+
+def pipeline_slug(pipeline_path: str, base_dir: str) -> str:
+    """Turn a pipeline path into a flat directory name, eg `group/project/.gitlab-ci.yml` -> `group__project__gitlab-ci`"""
+    relative = os.path.relpath(os.path.abspath(pipeline_path), os.path.abspath(base_dir))
+    relative = os.path.splitext(relative)[0]
+    parts = [part.lstrip(".") for part in relative.split(os.sep) if part not in ("", ".", "..")]
+    return "__".join(part for part in parts if part) or "pipeline"
+
+
+def pipeline_slugs(pipelines: list[str], base_dir: str) -> dict[str, str]:
+    """
+    The output directory name for each pipeline - its slug, plus a short hash of its relative path where two pipelines'
+    slugs would otherwise be the same (eg `a/.ci.yml` and `a/ci.yml`, or `a__b/x.yml` and `a/b/x.yml`)
+    """
+    slugs = {path: pipeline_slug(path, base_dir) for path in pipelines}
+    counts = {}
+    for slug in slugs.values():
+        counts[slug] = counts.get(slug, 0) + 1
+    for path, slug in slugs.items():
+        if counts[slug] > 1:
+            relative = os.path.relpath(os.path.abspath(path), os.path.abspath(base_dir))
+            slugs[path] = f"{slug}-{hashlib.sha256(relative.encode('utf-8')).hexdigest()[:8]}"
+    return slugs
+
+
+def convert_pipeline(pipeline_path: str, output_dir: str, options: dict) -> dict:
+    """Convert a single pipeline and return its summary (never raises, so one bad pipeline doesn't stop the batch)"""
+    result = {"pipeline": pipeline_path, "output_dir": output_dir}
+    start = time.monotonic()
+    try:
+        with open(pipeline_path, "r") as f:
+            gitlab_yaml = f.read()
+        # local includes are relative to the repository the pipeline lives in
+        converter = GitLabToGitHubConverter(gitlab_yaml=gitlab_yaml, output_dir=output_dir,
+                                            include_root=os.path.dirname(os.path.abspath(pipeline_path)), **options)
+        converter.run()
+        result.update(converter.summary())
+    except Exception as e:
+        logger.error(f"Error converting {pipeline_path}: {e}")
+        result.update({"passed": False, "error": str(e)})
+    result["duration"] = round(time.monotonic() - start, 2)
+    return result
+
+
+def tier_totals(results: list[dict]) -> list[dict]:
+    """The attempts, passes and cost spent on each model tier across every pipeline"""
+    totals = {}
+    for result in results:
+        for tier in result.get("model_tiers", []):
+            total = totals.setdefault(tier["tier"], {"tier": tier["tier"], "model": tier["model"], "pipelines": 0, "attempts": 0, "passed": 0, "cost": 0.0})
+            total["pipelines"] += 1 if tier["attempts"] else 0
+            total["attempts"] += tier["attempts"]
+            total["passed"] += tier["passed"]
+            total["cost"] += tier["cost"]
+    return [totals[tier] for tier in sorted(totals)]
+
+
+def run_batch(source: str, output_root: str, workers: int = 4, **options) -> dict:
+    """Convert every pipeline found in `source` using a pool of `workers` converters and write an aggregate summary"""
+    pipelines, base_dir = find_pipelines(source)
+    logger.info(f"Found {len(pipelines)} pipelines to convert using {workers} workers")
+
+    slugs = pipeline_slugs(pipelines, base_dir)
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(convert_pipeline, path, os.path.join(output_root, slugs[path]), options): path
+            for path in pipelines
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            status = "passed" if result.get("passed") else "failed"
+            logger.info(f"Finished {result['pipeline']} ({status}, US${result.get('total_cost', 0)})")
+            results.append(result)
+
+    results.sort(key=lambda x: x["pipeline"])
+    summary = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "source": source,
+        "pipelines": results,
+        "totals": {
+            "pipelines": len(results),
+            "passed": sum(1 for r in results if r.get("passed")),
+            "failed": sum(1 for r in results if not r.get("passed")),
+            "attempts": sum(r.get("attempts", 0) for r in results),
+            "fast_path": sum(1 for r in results if r.get("fast_path")),
+            "similar_reused": sum(1 for r in results if r.get("similar_to")),
+            "shared_workflows_reused": sum(r.get("shared_workflows_reused", 0) for r in results),
+            "docs_index_hits": sum(r.get("docs_index_hits", 0) for r in results),
+            "model_tiers": tier_totals(results),
+            "total_cost": sum(r.get("total_cost", 0) for r in results),
+            "llm_cache_hits": sum(r.get("llm_cache_hits", 0) for r in results),
+            "docs_fetches_saved": sum(r.get("docs_fetches_saved", 0) for r in results),
+            "docs_summaries_saved": sum(r.get("docs_summaries_saved", 0) for r in results),
+        },
+    }
+
+    os.makedirs(output_root, exist_ok=True)
+    summary_filename = os.path.join(output_root, "summary.json")
+    with open(summary_filename, "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Batch summary written to {summary_filename}")
+
+    totals = summary["totals"]
+    logger.info(f"Converted {totals['passed']}/{totals['pipelines']} pipelines ({totals['fast_path']} by the fast path), total cost: US${totals['total_cost']}")
+    return summary
+
+
+if __name__ == "__main__":
+    default_model = "o4-mini"
+    parser = argparse.ArgumentParser(description="Convert a whole directory tree (or manifest) of GitLab pipelines")
+    parser.add_argument("source", type=str, help="Directory to search for .gitlab-ci.yml files, or a manifest file listing pipeline paths")
+    parser.add_argument("--output-dir", type=str, default="batch_output", help="Directory for the per-pipeline output directories and summary.json")
+    parser.add_argument("--workers", type=int, default=4, help="Number of pipelines to convert concurrently")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Maximum number of attempts to make per pipeline")
+    parser.add_argument("--debug-file", type=str, required=False, help="Path to a file for detailed debug logging")
+    parser.add_argument("--provider", type=str, required=False, default=os.getenv("LLM_PROVIDER", "openai"), help="LLM provider to use")
+    parser.add_argument("--thinking-model", type=str, required=False, default=os.getenv("LLM_THINKING_MODEL", default_model), help="LLM model to use for thinking")
+    parser.add_argument("--implementation-model", type=str, required=False, default=os.getenv("LLM_IMPLEMENTATION_MODEL", default_model), help="LLM model to use for implementation")
+    parser.add_argument("--thorough", action="store_true", required=False, default=False, help="Regenerate the GitHub YAML if the quality check fails")
+    parser.add_argument("--cache-dir", type=str, required=False, default=os.getenv("GL2GH_CACHE_DIR", ".gl2gh_cache"), help="Directory for the on-disk caches")
+    parser.add_argument("--no-cache", action="store_true", required=False, default=False, help="Don't read or write the on-disk caches (LLM responses and documentation)")
+    parser.add_argument("--docs-concurrency", type=int, required=False, default=4, help="Maximum number of documentation pages to fetch and summarise at once")
+    parser.add_argument("--docs-token-budget", type=int, required=False, default=1500, help="Approximate number of tokens of each documentation page to include when summarising it")
+    parser.add_argument("--candidates", type=int, required=False, default=1, help="Number of implementations to generate in parallel on each attempt (the best one is carried forward)")
+    parser.add_argument("--patch-repair", action="store_true", required=False, default=False, help="Fix failed attempts by asking for a patch against the previous workflow rather than a complete rewrite")
+    parser.add_argument("--decompose-jobs", type=int, required=False, default=0, help="Convert pipelines with more than this many jobs in parallel groups of this size (0 disables)")
+    parser.add_argument("--no-fast-path", action="store_true", required=False, default=False, help="Always use the LLM, even for pipelines simple enough for the rule-based translator")
+    parser.add_argument("--otlp-endpoint", type=str, required=False, default=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"), help="Send each run's timing spans to this OpenTelemetry collector (OTLP over HTTP, eg http://localhost:4318)")
+    parser.add_argument("--stream", action="store_true", required=False, default=False, help="Stream the generated workflows, abandoning and retrying ones which are clearly unusable part way through")
+    parser.add_argument("--model-tiers", type=str, nargs="+", required=False, default=os.getenv("LLM_MODEL_TIERS", "").split() or None, help="Implementation models to cascade through, cheapest first - the starting tier depends on the pipeline's complexity and failed attempts escalate to the next one (overrides --implementation-model)")
+    parser.add_argument("--escalate-after", type=int, required=False, default=1, help="Number of failed attempts on a model tier before escalating to the next")
+    parser.add_argument("--requests-per-minute", type=float, required=False, default=float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0)), help="Maximum LLM requests per minute to the provider, shared by all the workers (0 for no limit)")
+    parser.add_argument("--tokens-per-minute", type=float, required=False, default=float(os.getenv("LLM_TOKENS_PER_MINUTE", 0)), help="Maximum prompt tokens per minute to the provider, shared by all the workers (0 for no limit)")
+    parser.add_argument("--shared-workflows", action="store_true", required=False, default=False, help="Convert the jobs of locally included files into reusable workflows, once, and reuse them across pipelines")
+    parser.add_argument("--similarity-threshold", type=float, required=False, default=0, help="Give the implementation agent the workflow of a previously converted pipeline at least this similar (0-1, eg 0.85) as a reference (default: 0, disabled)")
+    parser.add_argument("--docs-index", type=str, required=False, default=DEFAULT_INDEX_PATH, help="Index of pre-written guidance for actionlint's errors, checked before fetching any documentation (an empty string disables it)")
+    parser.add_argument("--offline-docs", action="store_true", required=False, default=False, help="Never fetch documentation - only use the docs index and previously stored summaries")
+    args = parser.parse_args()
+
+    setup_logging(args.debug_file)
+    summary = run_batch(
+        args.source,
+        args.output_dir,
+        workers=args.workers,
+        max_attempts=args.max_attempts,
+        provider=args.provider,
+        thinking_model=args.thinking_model,
+        implementation_model=args.implementation_model,
+        thorough=args.thorough,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        docs_concurrency=args.docs_concurrency,
+        docs_token_budget=args.docs_token_budget,
+        otlp_endpoint=args.otlp_endpoint,
+        candidates=args.candidates,
+        patch_repair=args.patch_repair,
+        decompose_jobs=args.decompose_jobs,
+        fast_path=not args.no_fast_path,
+        stream=args.stream,
+        model_tiers=args.model_tiers,
+        escalate_after=args.escalate_after,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        shared_workflows=args.shared_workflows,
+        similarity_threshold=args.similarity_threshold,
+        docs_index=args.docs_index,
+        offline_docs=args.offline_docs,
+    )
+    exit(0 if summary["totals"]["failed"] == 0 else 1)
@@ -0,0 +1,241 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from unittest import mock
+import agents.base_agent
+import agents.validator
+from benchmarks.replay import ReplayLLM
+from main import GitLabToGitHubConverter
+
+logger = logging.getLogger("gl2gh")
+
+FIXTURES_DIR = os.path.join("benchmarks", "fixtures")
+RESULTS_DIR = os.path.join("benchmarks", "results")
+PIPELINE_FILENAME = "gitlab-ci.yml"
+PAGES_FILENAME = "pages.json"
+# stages timed around the converter's own work, rather than LLM calls
+TIMED_STAGES = ["fast_path", "actionlint", "docs_fetch"]
+# the numbers compared against a baseline run
+COMPARED_METRICS = ["wall_time", "attempts", "llm_calls", "prompt_tokens", "cached_tokens", "completion_tokens", "actionlint_invocations"]
+
+
+def find_fixtures(fixtures_dir: str, names: list[str] | None = None) -> list[str]:
+    """The fixture directories (each holding a `gitlab-ci.yml` and its recorded responses), optionally just the named ones"""
+    fixtures = []
+    for name in sorted(os.listdir(fixtures_dir)):
+        path = os.path.join(fixtures_dir, name)
+        if os.path.exists(os.path.join(path, PIPELINE_FILENAME)) and (not names or name in names):
+            fixtures.append(path)
+    return fixtures
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{revision}-dirty" if dirty else revision
+
+
+def timed(function, stage: str, replay: ReplayLLM):
+    """Wrap `function` so the time spent in it is added to `stage` in the replay stats"""
+    def wrapper(*args, **kwargs):
+        start = time.monotonic()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            replay.add_stats(stage, time.monotonic() - start)
+    return wrapper
+
+
+def run_fixture(fixture_dir: str, options: dict, latency: float = 0.0, latency_per_token: float = 0.0, record: bool = False) -> dict:
+    """Convert one fixture with the replaying LLM (or a real one, recording its responses) and return its measurements"""
+    name = os.path.basename(fixture_dir)
+    with open(os.path.join(fixture_dir, PIPELINE_FILENAME), "r") as f:
+        gitlab_yaml = f.read()
+    pages_path = os.path.join(fixture_dir, PAGES_FILENAME)
+    pages = {}
+    if os.path.exists(pages_path) and not record:
+        with open(pages_path, "r") as f:
+            pages = json.load(f)
+
+    if record:
+        replay = ReplayLLM(record=agents.base_agent.completion)
+    else:
+        replay = ReplayLLM.from_fixture(fixture_dir, latency=latency, latency_per_token=latency_per_token)
+
+    result = {"fixture": name}
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory() as output_dir, ExitStack() as stack:
+        stack.enter_context(mock.patch.object(agents.base_agent, "completion", replay.completion))
+        stack.enter_context(mock.patch.object(agents.validator, "run", timed(agents.validator.run, "actionlint", replay)))
+        try:
+            converter = GitLabToGitHubConverter(gitlab_yaml=gitlab_yaml, output_dir=output_dir, use_cache=False, **options)
+            converter.fast_path_translator.run = timed(converter.fast_path_translator.run, "fast_path", replay)
+            if record:
+                fetch_page = converter.docs_agent.fetch_page
+                def record_page(url: str) -> str:
+                    pages[url] = fetch_page(url)
+                    return pages[url]
+                converter.docs_agent.fetch_page = timed(record_page, "docs_fetch", replay)
+            else:
+                # documentation pages are replayed too, so the benchmark never touches the network
+                converter.docs_agent.fetch_page = timed(lambda url: pages.get(url, ""), "docs_fetch", replay)
+            converter.run()
+            summary = converter.summary()
+            result.update({
+                "passed": summary["passed"],
+                "quality_check_passed": summary["quality_check_passed"],
+                "fast_path": summary["fast_path"],
+                "attempts": summary["attempts"],
+                "validation_errors": summary["validation_errors"],
+                "actionlint_invocations": summary["actionlint_invocations"],
+                "complexity": summary["complexity"],
+                "model_tiers": summary["model_tiers"],
+            })
+        except Exception as e:
+            logger.error(f"Error benchmarking {name}: {e}")
+            result.update({"passed": False, "error": str(e)})
+    result["wall_time"] = round(time.monotonic() - start, 3)
+
+    llm_stages = {stage: stats for stage, stats in replay.stats.items() if stage not in TIMED_STAGES}
+    result["llm_calls"] = sum(stats["calls"] for stats in llm_stages.values())
+    result["prompt_tokens"] = sum(stats["prompt_tokens"] for stats in llm_stages.values())
+    result["completion_tokens"] = sum(stats["completion_tokens"] for stats in llm_stages.values())
+    result["cached_tokens"] = sum(stats["cached_tokens"] for stats in llm_stages.values())
+    result["stages"] = {stage: {**stats, "seconds": round(stats["seconds"], 3)} for stage, stats in sorted(replay.stats.items())}
+
+    if record:
+        replay.save(fixture_dir)
+        if pages:
+            with open(pages_path, "w") as f:
+                json.dump(pages, f, indent=2)
+                f.write("\n")
+        logger.info(f"Recorded responses for {name}")
+    return result
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """Lines describing how each fixture's measurements changed since the baseline run"""
+    baseline_fixtures = {fixture["fixture"]: fixture for fixture in baseline.get("fixtures", [])}
+    lines = [f"Compared with {baseline.get('revision', 'unknown')}:"]
+    for fixture in results["fixtures"]:
+        before = baseline_fixtures.get(fixture["fixture"])
+        if before is None:
+            lines.append(f"  {fixture['fixture']}: not in the baseline")
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            old, new = before.get(metric), fixture.get(metric)
+            if old is None or new is None or old == new:
+                continue
+            percent = f" ({(new - old) / old:+.0%})" if old else ""
+            changes.append(f"{metric} {old} -> {new}{percent}")
+        if before.get("passed") and not fixture.get("passed"):
+            changes.append("no longer passes")
+        lines.append(f"  {fixture['fixture']}: {', '.join(changes) if changes else 'no change'}")
+    return lines
+
+
+def run_benchmark(fixtures_dir: str = FIXTURES_DIR, names: list[str] | None = None, output: str | None = None,
+                  baseline: str | None = None, latency: float = 0.0, latency_per_token: float = 0.0,
+                  record: bool = False, **options) -> dict:
+    """Run every fixture (one at a time, so timings don't interfere), write the results to JSON and compare with a baseline"""
+    fixtures = find_fixtures(fixtures_dir, names)
+    logger.info(f"Benchmarking {len(fixtures)} fixtures")
+
+    revision = git_revision()
+    results = {
+        "revision": revision,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": {"latency": latency, "latency_per_token": latency_per_token, **options},
+        "fixtures": [run_fixture(fixture, options, latency, latency_per_token, record) for fixture in fixtures],
+    }
+    results["totals"] = {
+        "fixtures": len(results["fixtures"]),
+        "passed": sum(1 for fixture in results["fixtures"] if fixture.get("passed")),
+        **{metric: round(sum(fixture.get(metric) or 0 for fixture in results["fixtures"]), 3) for metric in COMPARED_METRICS},
+    }
+
+    output = output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{revision}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Benchmark results written to {output}")
+
+    for fixture in results["fixtures"]:
+        status = "passed" if fixture.get("passed") else "failed"
+        logger.info(f"  {fixture['fixture']}: {status} in {fixture['wall_time']}s, {fixture.get('attempts', 0)} attempts, "
+                    f"{fixture['llm_calls']} LLM calls, {fixture['prompt_tokens']}+{fixture['completion_tokens']} tokens "
+                    f"({fixture['cached_tokens']} cached), "
+                    f"{fixture.get('actionlint_invocations', 0)} actionlint runs")
+    if baseline:
+        with open(baseline, "r") as f:
+            for line in compare(results, json.load(f)):
+                logger.info(line)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark conversions offline by replaying recorded LLM responses")
+    parser.add_argument("fixtures", nargs="*", help="Names of the fixtures to run (default: all of them)")
+    parser.add_argument("--fixtures-dir", type=str, default=FIXTURES_DIR, help="Directory of benchmark fixtures")
+    parser.add_argument("--output", type=str, required=False, help="Path of the JSON results file (default: benchmarks/results/<timestamp>_<revision>.json)")
+    parser.add_argument("--baseline", type=str, required=False, help="A previous results file to compare against")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds each replayed LLM call takes")
+    parser.add_argument("--latency-per-token", type=float, default=0.0, help="Extra seconds per completion token for each replayed LLM call")
+    parser.add_argument("--record", action="store_true", default=False, help="Call the real LLM and save its responses as the fixtures' recordings")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Maximum number of attempts to make")
+    parser.add_argument("--provider", type=str, required=False, default=os.getenv("LLM_PROVIDER", "openai"), help="LLM provider to use when recording")
+    parser.add_argument("--thinking-model", type=str, required=False, default=os.getenv("LLM_THINKING_MODEL", "o4-mini"), help="LLM model to use for thinking when recording")
+    parser.add_argument("--implementation-model", type=str, required=False, default=os.getenv("LLM_IMPLEMENTATION_MODEL", "o4-mini"), help="LLM model to use for implementation when recording")
+    parser.add_argument("--thorough", action="store_true", required=False, default=False, help="Regenerate the GitHub YAML if the quality check fails")
+    parser.add_argument("--docs-token-budget", type=int, required=False, default=1500, help="Approximate number of tokens of each documentation page to include when summarising it")
+    parser.add_argument("--candidates", type=int, required=False, default=1, help="Number of implementations to generate in parallel on each attempt")
+    parser.add_argument("--patch-repair", action="store_true", required=False, default=False, help="Fix failed attempts by asking for a patch against the previous workflow")
+    parser.add_argument("--decompose-jobs", type=int, required=False, default=0, help="Convert pipelines with more than this many jobs in parallel groups of this size (0 disables)")
+    parser.add_argument("--no-fast-path", action="store_true", required=False, default=False, help="Always use the LLM, even for pipelines simple enough for the rule-based translator")
+    parser.add_argument("--verbose", action="store_true", required=False, default=False, help="Show the converter's own progress messages")
+    parser.add_argument("--stream", action="store_true", required=False, default=False, help="Stream the generated workflows, abandoning and retrying ones which are clearly unusable part way through")
+    parser.add_argument("--model-tiers", type=str, nargs="+", required=False, default=os.getenv("LLM_MODEL_TIERS", "").split() or None, help="Implementation models to cascade through, cheapest first - the starting tier depends on the pipeline's complexity and failed attempts escalate to the next one (overrides --implementation-model)")
+    parser.add_argument("--escalate-after", type=int, required=False, default=1, help="Number of failed attempts on a model tier before escalating to the next")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.DEBUG)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+    handler.setLevel(logging.INFO)
+    if not args.verbose:
+        # only the benchmark's own messages (the converter's are logged from main.py and the agents)
+        handler.addFilter(lambda record: record.module == "benchmark" or record.levelno >= logging.WARNING)
+    logger.addHandler(handler)
+
+    run_benchmark(
+        fixtures_dir=args.fixtures_dir,
+        names=args.fixtures,
+        output=args.output,
+        baseline=args.baseline,
+        latency=args.latency,
+        latency_per_token=args.latency_per_token,
+        record=args.record,
+        max_attempts=args.max_attempts,
+        provider=args.provider,
+        thinking_model=args.thinking_model,
+        implementation_model=args.implementation_model,
+        thorough=args.thorough,
+        docs_token_budget=args.docs_token_budget,
+        candidates=args.candidates,
+        patch_repair=args.patch_repair,
+        decompose_jobs=args.decompose_jobs,
+        fast_path=not args.no_fast_path,
+        stream=args.stream,
+        model_tiers=args.model_tiers,
+        escalate_after=args.escalate_after,
+    )
@@ -0,0 +1,169 @@
+import json
+import os
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+PROMPTS_DIR = "prompts"
+RESPONSES_FILENAME = "responses.json"
+
+class MissingRecording(KeyError):
+    """There's no recorded response for a stage of a fixture"""
+
+class ReplayLLM:
+    """
+    A stand-in for litellm's `completion` which replays recorded responses instead of calling a real model, so
+    conversions can be benchmarked without paying for (or waiting on) an API.
+
+    Each call is matched to a stage by the prompt template it was rendered from (`planning`, `implementation`,
+    `debugger`, `docs_summary`, ...) and gets the next recorded response for that stage - once they run out the last
+    one is repeated.  Every call sleeps for `latency` seconds plus `latency_per_token` seconds per completion token,
+    roughly like a real model would.
+
+    If `record` is given (the real `completion` function), calls are passed through to it and the responses saved
+    instead, so `save()` can write them out as a new recording.
+
+    Streamed calls (`stream=True`) get the response back a few tokens at a time, with the latency spread across them.
+
+    Like a provider's prompt cache, a system prompt that has been sent before is reported as cached tokens.
+
+    `stats` has the calls, wall time and prompt/completion tokens for each stage.
+    """
+
+    def __init__(self, responses: dict[str, list[str]] | None = None, latency: float = 0.0, latency_per_token: float = 0.0,
+                 record=None):
+        self.responses = responses or {}
+        self.latency = latency
+        self.latency_per_token = latency_per_token
+        self.record = record
+        self.recorded = {}
+        self.positions = {}
+        self.seen_system_prompts = set()
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.stage_prefixes = load_stage_prefixes()
+
+    @classmethod
+    def from_fixture(cls, fixture_dir: str, **kwargs) -> "ReplayLLM":
+        path = os.path.join(fixture_dir, RESPONSES_FILENAME)
+        responses = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                responses = json.load(f)
+        return cls(responses, **kwargs)
+
+    def save(self, fixture_dir: str):
+        with open(os.path.join(fixture_dir, RESPONSES_FILENAME), "w") as f:
+            json.dump(self.recorded, f, indent=2)
+            f.write("\n")
+
+    def completion(self, model: str, messages: list[dict], stream: bool = False, **kwargs):
+        prompt = "\n".join(message_text(message) for message in messages)
+        # the stage is decided by the template of the final (user) message - any system prompt is shared between stages
+        stage = self.stage_for(message_text(messages[-1]))
+        cached_tokens = self.cached_tokens(model, messages)
+        start = time.monotonic()
+
+        if self.record:
+            # streamed calls are recorded from a normal call and replayed as a stream
+            kwargs.pop("stream_options", None)
+            response = self.record(model=model, messages=messages, **kwargs)
+            content = response.choices[0].message.content
+            with self.lock:
+                self.recorded.setdefault(stage, []).append(content)
+            if not stream:
+                usage = getattr(response, "usage", None)
+                details = getattr(usage, "prompt_tokens_details", None)
+                self.add_stats(stage, time.monotonic() - start,
+                               getattr(usage, "prompt_tokens", None) or count_tokens(prompt),
+                               getattr(usage, "completion_tokens", None) or count_tokens(content or ""),
+                               getattr(details, "cached_tokens", None) or 0)
+                return response
+        else:
+            content = self.next_response(stage)
+
+        if stream:
+            return self.stream(stage, start, prompt, content or "", cached_tokens)
+
+        prompt_tokens = count_tokens(prompt)
+        completion_tokens = count_tokens(content)
+        time.sleep(self.latency + self.latency_per_token * completion_tokens)
+        self.add_stats(stage, time.monotonic() - start, prompt_tokens, completion_tokens, cached_tokens)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens,
+                                  prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens)),
+            _hidden_params={"response_cost": 0.0},
+        )
+
+    def stream(self, stage: str, start: float, prompt: str, content: str, cached_tokens: int = 0, tokens_per_chunk: int = 4):
+        """Yields the response in litellm-style chunks - only the tokens actually read count towards the stats"""
+        sent = 0
+        try:
+            if not self.record:
+                time.sleep(self.latency)
+            step = tokens_per_chunk * 4
+            for offset in range(0, len(content), step):
+                if not self.record:
+                    time.sleep(self.latency_per_token * tokens_per_chunk)
+                sent = offset + step
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[offset:offset + step]))])
+        finally:
+            self.add_stats(stage, time.monotonic() - start, count_tokens(prompt), count_tokens(content[:sent]), cached_tokens)
+
+    def next_response(self, stage: str) -> str:
+        with self.lock:
+            responses = self.responses.get(stage)
+            if not responses:
+                raise MissingRecording(f"no recorded response for the {stage} stage")
+            position = self.positions.get(stage, 0)
+            self.positions[stage] = position + 1
+            return responses[min(position, len(responses) - 1)]
+
+    def cached_tokens(self, model: str, messages: list[dict]) -> int:
+        if messages[0]["role"] != "system":
+            return 0
+        system_prompt = message_text(messages[0])
+        with self.lock:
+            seen = (model, system_prompt) in self.seen_system_prompts
+            self.seen_system_prompts.add((model, system_prompt))
+        return count_tokens(system_prompt) if seen else 0
+
+    def stage_for(self, prompt: str) -> str:
+        """The name of the prompt template the prompt was rendered from (the one with the longest matching opening text)"""
+        matches = [stage for stage, prefix in self.stage_prefixes.items() if prefix and prompt.startswith(prefix)]
+        if not matches:
+            return "unknown"
+        return max(matches, key=lambda stage: len(self.stage_prefixes[stage]))
+
+    def add_stats(self, stage: str, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0):
+        with self.lock:
+            stats = self.stats.setdefault(stage, {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cached_tokens"] += cached_tokens
+
+def load_stage_prefixes(prompts_dir: str = PROMPTS_DIR) -> dict[str, str]:
+    """The fixed text each prompt template starts with (everything before its first Jinja tag)"""
+    prefixes = {}
+    for filename in sorted(os.listdir(prompts_dir)):
+        if not filename.endswith(".md"):
+            continue
+        with open(os.path.join(prompts_dir, filename), "r") as f:
+            template = f.read()
+        prefixes[os.path.splitext(filename)[0]] = re.split(r"\{[{%#]", template, maxsplit=1)[0]
+    return prefixes
+
+def message_text(message: dict) -> str:
+    content = message["content"]
+    if isinstance(content, list):
+        return "\n".join(block.get("text", "") for block in content)
+    return content
+
+def count_tokens(text: str) -> int:
+    """A rough token count (about four characters to a token) - good enough to compare runs"""
+    return (len(text) + 3) // 4
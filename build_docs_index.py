@@ -0,0 +1,113 @@
+import argparse
+import hashlib
+import logging
+import os
+import time
+import requests
+from agents.doc_excerpt import DocExcerpter
+from agents.docs_index import DEFAULT_INDEX_PATH, DocsIndex, DocsIndexAgent
+
+logger = logging.getLogger("gl2gh")
+
+CHECKS_URL = "https://github.com/rhysd/actionlint/blob/main/docs/checks.md"
+# the same page as markdown - the rendered one is mostly GitHub's own page furniture
+CHECKS_SOURCE = "https://raw.githubusercontent.com/rhysd/actionlint/main/docs/checks.md"
+
+# actionlint's rule kinds (the `[kind]` at the end of its messages) and what each one checks
+RULES = {
+    "syntax-check": "Unexpected or missing keys and values of the wrong type in the workflow",
+    "expression": "Syntax, types, contexts and built-in functions in ${{ }} expressions, and where each context is available",
+    "action": "The format of `uses:` action references, their versions and the inputs passed to them",
+    "runner-label": "Runner labels in `runs-on`",
+    "job-needs": "Jobs named in `needs:`, and cycles between them",
+    "matrix": "Matrix values, include and exclude entries and references to matrix keys",
+    "events": "Webhook events, their activity types and filters, and schedule cron syntax",
+    "glob": "Glob patterns in branch, tag and path filters",
+    "permissions": "Scopes and levels in `permissions:`",
+    "workflow-call": "Calls to reusable workflows and their inputs, secrets and outputs",
+    "id": "Naming conventions and uniqueness of job and step ids",
+    "credentials": "Hard-coded credentials for containers and services",
+    "env-var": "Environment variable names",
+    "deprecated-commands": "Deprecated workflow commands such as set-output, save-state, set-env and add-path",
+    "shell-name": "Shell names in `shell:`",
+    "if-cond": "`if:` conditions which are always true or always false",
+    "shellcheck": "Problems shellcheck finds in `run:` scripts",
+    "pyflakes": "Problems pyflakes finds in Python `run:` scripts",
+    "actionlint": "Workflows actionlint cannot parse at all",
+}
+
+# pages actionlint links to in its messages, and what the linked error is about
+PAGES = {
+    "https://docs.github.com/en/actions/learn-github-actions/contexts#context-availability":
+        "A context used in a workflow key where it is not available",
+    "https://github.blog/changelog/2022-10-11-github-actions-deprecating-save-state-and-set-output-commands/":
+        "The deprecated set-output and save-state workflow commands",
+}
+
+
+def snapshot_path(snapshot_dir: str, url: str) -> str:
+    return os.path.join(snapshot_dir, hashlib.sha256(url.encode("utf-8")).hexdigest()[:16] + ".html")
+
+
+def get_page(url: str, snapshot_dir: str | None, offline: bool) -> str:
+    """The page's content - from the snapshot if it has it, otherwise fetched (and added to the snapshot)"""
+    path = snapshot_path(snapshot_dir, url) if snapshot_dir else None
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            return f.read()
+    if offline:
+        raise ValueError(f"{url} is not in the snapshot")
+    logger.info(f"Fetching {url}")
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    if path:
+        with open(path, "w") as f:
+            f.write(response.text)
+    return response.text
+
+
+def build_index(output: str, snapshot_dir: str | None = None, offline: bool = False, provider: str = "openai",
+                model: str = "o4-mini", token_budget: int = 1500) -> DocsIndex:
+    """Summarise each rule's and page's documentation into general guidance and save it as the docs index"""
+    if snapshot_dir:
+        os.makedirs(snapshot_dir, exist_ok=True)
+    excerpter = DocExcerpter(token_budget=token_budget)
+    agent = DocsIndexAgent(model_name=model, provider=provider)
+    total_cost = 0.0
+
+    def guidance(rule: str, description: str, url: str, source: str, kind: str | None = None) -> str:
+        nonlocal total_cost
+        page_content = excerpter.excerpt(get_page(source, snapshot_dir, offline), url, description, kind)
+        text, cost = agent.run(rule=rule, description=description, page_content=page_content)
+        total_cost += cost or 0
+        return text
+
+    index = DocsIndex(built=time.time())
+    for kind, description in RULES.items():
+        logger.info(f"Summarising the {kind} rule")
+        index.rules[kind] = {"url": CHECKS_URL, "guidance": guidance(kind, description, CHECKS_URL, CHECKS_SOURCE, kind)}
+    for url, description in PAGES.items():
+        logger.info(f"Summarising {url}")
+        index.pages[url] = {"guidance": guidance(description, description, url, url)}
+
+    index.save(output)
+    logger.info(f"Docs index with {len(index.rules)} rules and {len(index.pages)} pages written to {output} (cost: US${total_cost})")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the index of pre-written guidance for actionlint's errors")
+    parser.add_argument("--output", type=str, default=DEFAULT_INDEX_PATH, help="Path of the index to write")
+    parser.add_argument("--snapshot", type=str, required=False, help="Directory of saved documentation pages - pages missing from it are fetched and saved there")
+    parser.add_argument("--offline", action="store_true", required=False, default=False, help="Only use the pages in the snapshot - never fetch them")
+    parser.add_argument("--provider", type=str, required=False, default=os.getenv("LLM_PROVIDER", "openai"), help="LLM provider to use")
+    parser.add_argument("--model", type=str, required=False, default=os.getenv("LLM_THINKING_MODEL", "o4-mini"), help="LLM model to write the guidance with")
+    parser.add_argument("--docs-token-budget", type=int, required=False, default=1500, help="Approximate number of tokens of each documentation page to include when summarising it")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+    logger.addHandler(handler)
+
+    build_index(args.output, args.snapshot, args.offline, args.provider, args.model, args.docs_token_budget)
@@ -1,20 +1,42 @@
 import argparse
 import logging
 import os
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import requests
+import yaml
 from agents.planner import PlanningAgent
 from agents.implementing import ImplementationAgent
-from agents.validator import ValidationAgent
+from agents.validator import ValidationAgent, ValidationResult
 from agents.quick_fix import QuickFixAgent
 from agents.debug import DebugAgent
 from agents.docs import DocumentationSummarizer
 from agents.error_analyst import ErrorAnalysisAgent
 from agents.quality import QualityAgent
+from agents.patcher import PatchAgent, PatchError
+from agents.pipeline import GitLabPipeline
+from agents.decomposer import JobGroupAgent, group_plan, merge_workflows
+from agents.fast_path import FastPathTranslator
+from agents.llm_cache import LLMCache
+from agents.docs_index import DEFAULT_INDEX_PATH, DocsIndex
+from agents.docs_store import DocsStore
+from agents.telemetry import Tracer, OTLPExporter
+from agents.router import ModelRouter
+from agents.rate_limit import get_limiter
+from agents.checkpoint import Checkpoint, CheckpointError, STATE_SUFFIX
+from agents.includes import (IncludeResolver, SharedWorkflow, SharedWorkflowAgent, SharedWorkflowLibrary, add_calling_jobs,
+                             shareable_includes, shared_workflow_name, stage_dependencies, without_jobs)
+from agents.similarity import SimilarityIndex
+from agents.convergence import AttemptHistory
+from agents.yaml_utils import dump_yaml
 logger = logging.getLogger("gl2gh")
 
 
 def setup_logging(debug_filename: str | None):
+    if logger.handlers:
+        # already configured (eg, several converters running in one batch)
+        return
     logger.setLevel(logging.DEBUG)
 
     formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
@@ -39,58 +61,332 @@ def setup_logging(debug_filename: str | None):
         logger.addHandler(error_handler)
 
 class GitLabToGitHubConverter:
+    # how many times to change tack when attempts stop making progress, before giving up
+    max_strategy_changes = 1
+
     def __init__(self, gitlab_yaml: str, max_attempts: int = 3, debug_file: str | None = None,
-                 provider: str = "openrouter", thinking_model: str = "openai/o4-mini", implementation_model: str = "openai/o4-mini", thorough: bool = False):
+                 provider: str = "openrouter", thinking_model: str = "openai/o4-mini", implementation_model: str = "openai/o4-mini", thorough: bool = False,
+                 output_dir: str = ".", cache_dir: str = ".gl2gh_cache", use_cache: bool = True,
+                 docs_concurrency: int = 4, candidates: int = 1, patch_repair: bool = False,
+                 decompose_jobs: int = 0, fast_path: bool = True, docs_token_budget: int = 1500,
+                 otlp_endpoint: str | None = None, stream: bool = False, model_tiers: list[str] | None = None,
+                 escalate_after: int = 1, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 resume: str | None = None, include_root: str | None = None, shared_workflows: bool = False,
+                 similarity_threshold: float = 0, docs_index: str | DocsIndex | None = DEFAULT_INDEX_PATH, offline_docs: bool = False,
+                 docs_session: requests.Session | None = None):
         self.gitlab_yaml = gitlab_yaml
+        self.source_yaml = gitlab_yaml
         self.max_attempts = max_attempts
+        self.candidates = max(1, candidates)
+        self.patch_repair = patch_repair
+        self.decompose_jobs = decompose_jobs
+        self.fast_path = fast_path
+        self.stream = stream
+        self.router = ModelRouter(model_tiers, escalate_after) if model_tiers else None
+        self.used_fast_path = False
+        self.draft_workflow = ""
+        self.draft_gaps = []
+        self.reference_workflow = ""
+        self.similar_conversion = None
+        self.attempt_history = AttemptHistory()
+        self.stalled = None
+        self.strategy_changes = 0
+        self.variant_offset = 0
+        self.stopped_early = False
         self.provider = provider
         self.thinking_model = thinking_model
         self.implementation_model = implementation_model
         self.thorough = thorough
         self.total_cost = 0
-        self.output_basename = f"output_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.cost_lock = threading.Lock()
+        self.attempts = 0
+        self.passed = False
+        self.quality_check_result = False
+        self.final_validation_errors = None
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_basename = os.path.join(output_dir, f"output_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
         self.output_results = []
 
         setup_logging(debug_file)
+        # progress is saved after every stage so an interrupted run can be picked up again with --resume
+        self.resume_state = None
+        if resume:
+            self.checkpoint = Checkpoint.for_run(resume)
+            self.resume_state = self.checkpoint.load(self.source_yaml)
+            self.output_basename = self.resume_state["output_basename"]
+        else:
+            self.checkpoint = Checkpoint(f"{self.output_basename}{STATE_SUFFIX}")
         logger.info(f"Using thinking model: {thinking_model} ({provider})")
-        logger.info(f"Using implementation model: {implementation_model} ({provider})")
+        if self.router:
+            logger.info(f"Using implementation model tiers: {', '.join(model_tiers)} ({provider})")
+        else:
+            logger.info(f"Using implementation model: {implementation_model} ({provider})")
+        if self.candidates > 1:
+            logger.info(f"Generating {self.candidates} candidate implementations per attempt")
+
+        # local includes are merged in so the LLM sees the whole pipeline
+        self.included_files = []
+        if include_root:
+            self.gitlab_yaml, self.included_files = IncludeResolver(include_root).resolve(gitlab_yaml)
+        self.use_shared_workflows = shared_workflows
+        self.shared_workflows = []
+
+        self.llm_cache = LLMCache(os.path.join(cache_dir, "llm")) if use_cache else None
+        self.docs_store = DocsStore(os.path.join(cache_dir, "docs.sqlite3")) if use_cache else None
+        self.similarity_index = SimilarityIndex(os.path.join(cache_dir, "similar"), similarity_threshold) if use_cache and similarity_threshold else None
+        # a long-running process passes in the loaded index, rather than each conversion reading it again
+        self.docs_index = DocsIndex.load(docs_index) if isinstance(docs_index, str) and docs_index else docs_index or None
+        self.tracer = Tracer()
+        # the limiter is shared by every agent (and every converter in the process) using this provider
+        self.limiter = get_limiter(provider)
+        self.limiter.configure(requests_per_minute, tokens_per_minute)
+        self.otlp_exporter = OTLPExporter(otlp_endpoint) if otlp_endpoint else None
 
         # Initialize agents
-        self.planner = PlanningAgent(model_name=thinking_model, provider=provider)
-        self.worker_agent = ImplementationAgent(model_name=implementation_model, provider=provider)
-        self.docs_agent = DocumentationSummarizer(model_name=thinking_model, provider=provider)
-        self.validation_agent = ValidationAgent()
+        self.planner = PlanningAgent(model_name=thinking_model, provider=provider, cache=self.llm_cache, tracer=self.tracer)
+        self.worker_agent = ImplementationAgent(model_name=implementation_model, provider=provider, cache=self.llm_cache, tracer=self.tracer,
+                                                stream=stream)
+        self.docs_agent = DocumentationSummarizer(model_name=thinking_model, provider=provider, max_concurrency=docs_concurrency, store=self.docs_store,
+                                                 token_budget=docs_token_budget, cache=self.llm_cache, tracer=self.tracer,
+                                                 index=self.docs_index, offline=offline_docs, session=docs_session)
+        self.validation_agent = ValidationAgent(tracer=self.tracer)
         self.quick_fix_agent = QuickFixAgent()
-        self.quality_agent = QualityAgent(model_name=thinking_model, provider=provider)
+        self.fast_path_translator = FastPathTranslator()
+        self.analysis_agent = ErrorAnalysisAgent(model_name=thinking_model, provider=provider, cache=self.llm_cache, tracer=self.tracer)
+        self.quality_agent = QualityAgent(model_name=thinking_model, provider=provider, cache=self.llm_cache, tracer=self.tracer)
+        self.patch_agent = PatchAgent(model_name=implementation_model, provider=provider, cache=self.llm_cache, tracer=self.tracer)
+        self.job_group_agent = JobGroupAgent(model_name=implementation_model, provider=provider, cache=self.llm_cache, tracer=self.tracer)
+        self.shared_workflow_agent = SharedWorkflowAgent(model_name=implementation_model, provider=provider, cache=self.llm_cache, tracer=self.tracer)
+        self.shared_workflow_library = SharedWorkflowLibrary(os.path.join(cache_dir, "shared_workflows") if use_cache else None)
 
     def create_implementation_plan(self):
         """Generate a plan for implementation using the planning agent"""
         logger.info("Getting implementation plan")
         plan, cost = self.planner.run(gitlab_yaml=self.gitlab_yaml)
         logger.debug(f"## Planning (cost: US${cost})\n{plan}")
-        self.total_cost += cost
+        self.add_cost(cost)
         return plan
 
+    def add_cost(self, cost: float):
+        """Add to the running total (candidates are generated from several threads at once)"""
+        with self.cost_lock:
+            self.total_cost += cost
+
     def implement_solution(self, plan: str, error_message: str = "",
-                           error_guidance: str = "", previous_implementation: str = ""):
+                           error_guidance: str = "", previous_implementation: str = "", variant: int = 0):
         """Generate an implementation based on the plan and any error feedback"""
+        variant += self.variant_offset
+        # a stalled conversion gets a full rewrite - patching clearly isn't getting anywhere
+        if self.patch_repair and previous_implementation and not self.stalled:
+            implementation = self.repair_with_patch(plan, error_message, error_guidance, previous_implementation, variant)
+            if implementation:
+                return implementation
+
+        # when streaming, the attempt's output file fills up as the workflow arrives
+        candidate = variant - self.variant_offset + 1 if self.candidates > 1 else None
         implementation, cost = self.worker_agent.run(
+            variant=variant,
+            stream_to=self.implementation_filename(self.attempts, candidate=candidate) if self.stream else None,
             gitlab_yaml=self.gitlab_yaml,
             user_thoughts=plan,
             error_message=error_message,
             error_guidence=error_guidance,
-            previous_attempt=previous_implementation
+            previous_attempt=previous_implementation,
+            draft_workflow=self.draft_workflow,
+            draft_gaps=self.draft_gaps,
+            reference_workflow=self.reference_workflow,
+            stalled=self.stalled
         )
         implementation = self.quick_fix_agent.run(implementation)
 
         logger.debug(f"## Implementation (cost: US${cost})\n{implementation}")
-        self.total_cost += cost
+        self.add_cost(cost)
 
         return implementation
 
-    def save_implementation(self, implementation: str, attempt: int, is_final: bool = False):
+    def repair_with_patch(self, plan: str, error_message: str, error_guidance: str, previous_implementation: str,
+                          variant: int = 0) -> str | None:
+        """Ask for a patch against the previous implementation and apply it - returns None if the patch can't be applied"""
+        patch, cost = self.patch_agent.run(
+            variant=variant,
+            gitlab_yaml=self.gitlab_yaml,
+            user_thoughts=plan,
+            previous_attempt=previous_implementation,
+            error_message=error_message,
+            error_guidence=error_guidance,
+            stalled=self.stalled
+        )
+        self.add_cost(cost)
+        logger.debug(f"## Patch (cost: US${cost})\n{patch}")
+        try:
+            implementation = self.patch_agent.apply(previous_implementation, patch)
+        except PatchError as e:
+            logger.info(f"Could not apply patch ({e}) - regenerating the whole workflow")
+            return None
+        return self.quick_fix_agent.run(implementation)
+
+    def try_fast_path(self) -> str | None:
+        """
+        Translate the pipeline with the rule-based translator.  Returns the workflow if it handled the whole pipeline and
+        the result passes validation - otherwise whatever it could translate is kept as a draft for the LLM.
+        """
+        with self.tracer.span("fast_path") as span:
+            workflow, unsupported = self.fast_path_translator.run(self.gitlab_yaml)
+            span.set(unsupported=len(unsupported))
+        if not workflow:
+            return None
+        if unsupported:
+            logger.info(f"Fast path can't handle the whole pipeline ({len(unsupported)} unsupported features) - using it as a draft")
+            logger.debug(f"Unsupported by the fast path: {unsupported}")
+            self.draft_workflow, self.draft_gaps = workflow, unsupported
+            return None
+
+        workflow = self.add_shared_workflow_jobs(workflow)
+        output_filename = self.save_implementation(workflow, 0, name="fast_path")
+        result = self.validate_implementation(workflow, 0, output_filename)
+        if not result.passed:
+            logger.info("Fast path output failed validation - using it as a draft")
+            self.draft_workflow, self.draft_gaps = workflow, [str(error) for error in result.errors]
+            return None
+
+        logger.info("Pipeline converted by the fast path - skipping the LLM stages")
+        self.used_fast_path = True
+        self.final_validation_errors = 0
+        return workflow
+
+    def convert_job_groups(self) -> tuple[str, str] | None:
+        """
+        Convert a large pipeline a group of jobs at a time (in parallel) and merge the results into a single workflow.
+        Returns the workflow and a short plan describing the groups, or None if the pipeline is small enough (or too
+        unusual, or a group fails to convert) to be converted in one go.
+        """
+        try:
+            pipeline = GitLabPipeline(self.gitlab_yaml)
+        except (ValueError, yaml.YAMLError) as e:
+            logger.info(f"Could not split the pipeline into jobs ({e}) - converting it as a whole")
+            return None
+        if len(pipeline.jobs) <= self.decompose_jobs:
+            return None
+
+        groups = pipeline.job_groups(self.decompose_jobs)
+        logger.info(f"Converting {len(pipeline.jobs)} jobs in {len(groups)} groups")
+
+        def convert_group(names: list[str]) -> str:
+            workflow, cost = self.job_group_agent.run_group(pipeline, names)
+            self.add_cost(cost)
+            logger.debug(f"## Job group {names} (cost: US${cost})\n{workflow}")
+            return self.quick_fix_agent.run(workflow)
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(groups), 8)) as executor:
+                workflows = list(executor.map(convert_group, groups))
+        except Exception as e:
+            logger.info(f"Could not convert the job groups ({e}) - converting the pipeline as a whole")
+            return None
+
+        try:
+            return merge_workflows(workflows), group_plan(pipeline, groups)
+        except (ValueError, yaml.YAMLError) as e:
+            logger.info(f"Could not merge the converted job groups ({e}) - converting the pipeline as a whole")
+            return None
+
+    def convert_shared_includes(self):
+        """
+        Convert the jobs of each shared include into a reusable workflow - or reuse the conversion from an earlier
+        pipeline which included the same file - and take those jobs out of the pipeline the LLM converts
+        """
+        taken = set()
+        for file in shareable_includes(self.source_yaml, self.gitlab_yaml, self.included_files):
+            name = shared_workflow_name(file.path, taken)
+            taken.add(name)
+            # the included jobs as this pipeline runs them - with its variables and defaults, which they inherit
+            pipeline = GitLabPipeline(self.gitlab_yaml)
+            needs, needed_by = stage_dependencies(pipeline, file.job_names)
+            shared = SharedWorkflow(path=file.path, name=name, job_id=f"{name}-workflow", jobs=file.job_names,
+                                    needs=needs, needed_by=needed_by)
+            key = self.shared_workflow_library.key(pipeline, file.job_names)
+            with self.shared_workflow_library.lock(key):
+                workflow = self.shared_workflow_library.get(key)
+                if workflow:
+                    logger.info(f"Reusing the converted workflow for {file.path}")
+                    shared.reused = True
+                else:
+                    logger.info(f"Converting shared include {file.path} into a reusable workflow")
+                    workflow, cost = self.shared_workflow_agent.run_include(file.path, pipeline, file.job_names)
+                    self.add_cost(cost)
+                    workflow = self.quick_fix_agent.run(workflow)
+                    result = self.validation_agent.run(workflow)
+                    if not result.passed:
+                        logger.info(f"Reusable workflow for {file.path} failed validation ({len(result.errors)} errors) - converting its jobs with the pipeline")
+                        continue
+                    self.shared_workflow_library.put(key, workflow)
+            shared.workflow = workflow
+            shared.filename = self.save_implementation(workflow, 0, name=f"workflow_{name}")
+            self.shared_workflows.append(shared)
+
+        if self.shared_workflows:
+            self.gitlab_yaml = without_jobs(self.gitlab_yaml, self.shared_workflows)
+            logger.debug(f"Pipeline left for the LLM:\n{self.gitlab_yaml}")
+
+    def add_shared_workflow_jobs(self, implementation: str) -> str:
+        """Add the jobs which call the shared includes' reusable workflows (if there are any)"""
+        if not self.shared_workflows:
+            return implementation
+        return add_calling_jobs(implementation, self.shared_workflows)
+
+    def generate_candidates(self, plan: str, error_message: str = "",
+                            error_guidance: str = "", previous_implementation: str = "") -> list[str]:
+        """Generate `self.candidates` independent implementations in parallel"""
+        if self.candidates == 1:
+            return [self.implement_solution(plan, error_message, error_guidance, previous_implementation)]
+
+        with ThreadPoolExecutor(max_workers=self.candidates) as executor:
+            return list(executor.map(
+                lambda variant: self.implement_solution(plan, error_message, error_guidance, previous_implementation, variant),
+                range(self.candidates)
+            ))
+
+    def select_candidate(self, implementations: list[str], attempt: int) -> tuple[str, ValidationResult]:
+        """
+        Validate the candidate implementations (in a single actionlint run) and pick the best one - the first
+        that passes, otherwise the one with the fewest validation errors.
+        Returns the chosen implementation along with its validation result.
+        """
+        implementations = [self.add_shared_workflow_jobs(implementation) for implementation in implementations]
+        if len(implementations) == 1:
+            self.save_implementation(implementations[0], attempt)
+            result = self.validate_implementation(implementations[0], attempt)
+            self.final_validation_errors = len(result.errors)
+            return implementations[0], result
+
+        results = self.validation_agent.run_many(implementations)
+        best = None
+        for candidate, (implementation, result) in enumerate(zip(implementations, results), start=1):
+            output_filename = self.save_implementation(implementation, attempt, candidate=candidate)
+            self.validate_implementation(implementation, attempt, output_filename, result)
+            if best is None or (not result.passed, len(result.errors)) < (not best[2].passed, len(best[2].errors)):
+                best = (candidate, implementation, result)
+
+        candidate, implementation, result = best
+        logger.info(f"Selected candidate {candidate} ({len(result.errors)} errors)")
+        self.final_validation_errors = len(result.errors)
+        self.save_implementation(implementation, attempt)
+        return implementation, result
+
+    def implementation_filename(self, attempt: int, is_final: bool = False, candidate: int | None = None,
+                                name: str | None = None) -> str:
+        if name:
+            return f"{self.output_basename}_{name}.yml"
+        if is_final:
+            return f"{self.output_basename}_final.yml"
+        if candidate:
+            return f"{self.output_basename}_{attempt}_candidate_{candidate}.yml"
+        return f"{self.output_basename}_{attempt}.yml"
+
+    def save_implementation(self, implementation: str, attempt: int, is_final: bool = False, candidate: int | None = None,
+                            name: str | None = None):
         """Save the implementation to a file"""
-        output_filename = f"{self.output_basename}_final.yml" if is_final else f"{self.output_basename}_{attempt}.yml"
+        output_filename = self.implementation_filename(attempt, is_final, candidate, name)
         with open(output_filename, "w") as f:
             f.write(implementation)
             logger.info(f"Output written to {output_filename}")
@@ -104,46 +400,39 @@ class GitLabToGitHubConverter:
             logger.info(f"Quality check written to {output_filename}")
         return output_filename
 
-    def validate_implementation(self, implementation: str, attempt: int):
-        """Validate the implementation and record results"""
-        exit_code, stdout, stderr = self.validation_agent.run(implementation)
-
-        logger.debug(f"Validation exit code:\n{exit_code}")
-        logger.debug(f"Validation stdout:\n{stdout}")
-        logger.debug(f"Validation stderr:\n{stderr}")
-
-        if exit_code is True:
+    def validate_implementation(self, implementation: str, attempt: int, output_filename: str | None = None,
+                                result: ValidationResult | None = None) -> ValidationResult:
+        """Validate the implementation (unless we already have its result) and record results"""
+        output_filename = output_filename or f"{self.output_basename}_{attempt}.yml"
+        if result is None:
+            result = self.validation_agent.run(implementation)
+
+        logger.debug(f"Validation passed: {result.passed}")
+        logger.debug(f"Validation errors:\n{result.error_message}")
+        logger.debug(f"Validation stderr:\n{result.stderr}")
+
+        self.output_results.append({
+            "attempt": attempt,
+            "output_filename": output_filename,
+            "validation_errors": len(result.errors)
+        })
+        if result.passed:
             logger.info("Validation passed")
-            self.output_results.append({
-                "attempt": attempt,
-                "output_filename": f"{self.output_basename}_{attempt}.yml",
-                "validation_errors": 0
-            })
-            return True, "", ""
         else:
-            lines = stdout.split("\n")
-            validation_errors = [line for line in lines if line.startswith("../")]
-            logger.info(f"Validation failed ({len(validation_errors)} errors)")
-
-            self.output_results.append({
-                "attempt": attempt,
-                "output_filename": f"{self.output_basename}_{attempt}.yml",
-                "validation_errors": len(validation_errors)
-            })
-
-            cleaned_lines = [
-                re.sub(r'^.*?(\d+:\d+:)', r'\1', line)
-                for line in stdout.splitlines()
-            ]
-            error_message = "\n".join(cleaned_lines)
-            logger.debug(f"Raw error message: {error_message}")
-
-            return False, error_message, stdout
-
-    def process_errors(self, error_message: str, implementation: str, docs: list):
+            logger.info(f"Validation failed ({len(result.errors)} errors)")
+
+        return result
+
+    def process_errors(self, result: ValidationResult, implementation: str, docs: list):
         """Process errors and retrieve relevant documentation"""
+        # the same errors as an earlier attempt get the same guidance - there's no need to pay for it again
+        error_guidance = self.attempt_history.get_guidance(result.errors)
+        if error_guidance is not None:
+            logger.info("Reusing the guidance for these errors from an earlier attempt")
+            return error_guidance, docs
+
         logger.info("Looking up docs for errors")
-        applicable_docs, updated_docs = self.docs_agent.process_errors(error_message, implementation, docs)
+        applicable_docs, updated_docs = self.docs_agent.process_errors(result.errors, implementation, docs)
 
         logger.debug(f"Returned {len(applicable_docs)} applicable docs and {len(updated_docs)} total docs")
 
@@ -156,22 +445,46 @@ class GitLabToGitHubConverter:
 
         # Analyze errors for additional guidance
         logger.info("Analyzing errors")
-        analysis_agent = ErrorAnalysisAgent(model_name=self.thinking_model, provider=self.provider)
-        error_guidance, cost = analysis_agent.run(
-            error_message=error_message,
+        error_guidance, cost = self.analysis_agent.run(
+            error_message=result.error_message,
             implementation=implementation,
             error_guidence=error_guidance
         )
-        self.total_cost += cost
+        self.add_cost(cost)
         logger.debug(f"Error guidance: {error_guidance}")
+        self.attempt_history.set_guidance(result.errors, error_guidance)
 
         return error_guidance, updated_docs
 
+    def change_strategy(self, reason: str) -> bool:
+        """
+        Attempts have stopped making progress - try something different for the next one: tell the model its last fix
+        didn't work, rewrite the whole workflow rather than patching it, and ask for a fresh variant of the response
+        (so the LLM cache doesn't just hand back the same one).  Returns False if we've already changed tack as often
+        as we're allowed, and should stop.
+        """
+        self.stalled = reason
+        if self.strategy_changes >= self.max_strategy_changes:
+            logger.info(f"No progress ({reason}) after changing strategy - stopping early")
+            self.stopped_early = True
+            return False
+        self.strategy_changes += 1
+        logger.info(f"No progress ({reason}) - asking for a different approach")
+        self.variant_offset += self.candidates
+        return True
+
+    def use_implementation_model(self, model: str):
+        """Switch every implementation agent over to `model` (when the router picks or escalates a tier)"""
+        self.implementation_model = model
+        for agent in (self.worker_agent, self.patch_agent, self.job_group_agent, self.shared_workflow_agent):
+            agent.model_name = model
+
     def switch_to_debug_agent_if_needed(self):
         """Switch to debug agent if not already using it"""
         if not isinstance(self.worker_agent, DebugAgent):
             logger.debug("Switching to debug agent")
-            self.worker_agent = DebugAgent(model_name=self.implementation_model, provider=self.provider)
+            self.worker_agent = DebugAgent(model_name=self.implementation_model, provider=self.provider, cache=self.llm_cache, tracer=self.tracer,
+                                           stream=self.stream)
 
     def display_results(self):
         """Display the results of all attempts"""
@@ -180,6 +493,33 @@ class GitLabToGitHubConverter:
         for result in self.output_results:
             logger.info(f"  - {result['output_filename']} ({result['validation_errors']} errors)")
 
+    def summary(self) -> dict:
+        """Summarise the outcome of the run (used for batch reports)"""
+        return {
+            "passed": self.passed,
+            "quality_check_passed": self.quality_check_result,
+            "attempts": self.attempts,
+            "validation_errors": self.final_validation_errors,
+            "total_cost": self.total_cost,
+            "fast_path": self.used_fast_path,
+            "actionlint_invocations": self.validation_agent.invocations,
+            "output_basename": self.output_basename,
+            "resumed": self.resume_state is not None,
+            "strategy_changes": self.strategy_changes,
+            "stopped_early": self.stopped_early,
+            "similar_to": self.similar_conversion["key"] if self.similar_conversion else None,
+            "similarity": self.similar_conversion["similarity"] if self.similar_conversion else None,
+            "shared_workflows": len(self.shared_workflows),
+            "shared_workflows_reused": sum(1 for shared in self.shared_workflows if shared.reused),
+            "complexity": self.router.score if self.router else None,
+            "model_tiers": self.router.stats() if self.router else [],
+            "llm_cache_hits": self.llm_cache.hits if self.llm_cache else 0,
+            "llm_cache_misses": self.llm_cache.misses if self.llm_cache else 0,
+            "docs_fetches_saved": self.docs_store.fetches_saved if self.docs_store else 0,
+            "docs_summaries_saved": self.docs_store.summaries_saved if self.docs_store else 0,
+            "docs_index_hits": self.docs_agent.index_hits,
+        }
+
     def quality_check_passed(self, quality_check: str):
         """Check if the quality check passed"""
         lines = quality_check.lower().split("\n")
@@ -190,43 +530,85 @@ class GitLabToGitHubConverter:
 
     def run(self):
         """Main execution flow of the converter"""
-        # Create implementation plan
-        plan = self.create_implementation_plan()
-
-        # Implementation and validation loop
-        attempts = 0
-        passes = False
-        quality_check_passed = False
-        previous_implementation = ""
-        error_message = ""
-        error_guidance = ""
-        quality_check = ""
-        docs = []
-
-        while not passes and not (quality_check_passed and self.thorough) and attempts < self.max_attempts:
+        # the limiter's count covers the whole process, so only report the retries made since this run started
+        self.starting_retries = self.limiter.retries
+        state = self.resume_state or {}
+        if state:
+            self.restore_state(state)
+        else:
+            # Shared includes are converted once, into reusable workflows, leaving just the pipeline's own jobs
+            if self.use_shared_workflows and self.included_files:
+                self.convert_shared_includes()
+
+            # Simple pipelines can be translated without the LLM at all
+            if self.fast_path:
+                workflow = self.try_fast_path()
+                if workflow:
+                    return self.finish(workflow, 0, True, False, "")
+
+            # Start on the model tier that suits the pipeline's complexity
+            if self.router:
+                self.use_implementation_model(self.router.start(self.gitlab_yaml))
+
+        if state:
+            plan = state["plan"]
+            initial_implementation = state["initial_implementation"]
+        else:
+            # A lookalike of a pipeline we've already converted - its workflow is given to the implementation agent as a reference
+            self.find_similar_conversion()
+
+            # Large pipelines can be converted a group of jobs at a time, in which case there's no need for a plan of the whole file
+            grouped = self.convert_job_groups() if self.decompose_jobs else None
+
+            # Create implementation plan
+            initial_implementation, plan = grouped if grouped else (None, self.create_implementation_plan())
+            self.save_state("plan", plan=plan, initial_implementation=initial_implementation)
+
+        # Implementation and validation loop (carrying on from the last completed attempt if we're resuming)
+        attempts = state.get("attempts", 0)
+        passes = state.get("passes", False)
+        quality_check_passed = state.get("quality_check_passed", False)
+        implementation = state.get("implementation", "")
+        previous_implementation = state.get("previous_implementation", "")
+        error_message = state.get("error_message", "")
+        error_guidance = state.get("error_guidance", "")
+        quality_check = state.get("quality_check", "")
+        docs = state.get("docs", [])
+
+        while not passes and not (quality_check_passed and self.thorough) and attempts < self.max_attempts and not self.stopped_early:
             attempts += 1
+            self.attempts = attempts
+            self.tracer.attempt = attempts
+            attempt_cost = self.total_cost
             logger.info(f"Implementing (attempt {attempts})")
             logger.debug(f"Error message: {error_message}")
 
-            # Generate implementation
-            implementation = self.implement_solution(
-                plan, error_message, error_guidance, previous_implementation
-            )
-
-            # Save current implementation
-            self.save_implementation(implementation, attempts)
+            # Generate implementation(s)
+            if initial_implementation:
+                implementations = [initial_implementation]
+                initial_implementation = None
+            else:
+                implementations = self.generate_candidates(
+                    plan, error_message, error_guidance, previous_implementation
+                )
 
-            # Validate implementation
-            passes, error_message, stdout = self.validate_implementation(implementation, attempts)
+            # Save and validate, carrying forward the best candidate
+            implementation, result = self.select_candidate(implementations, attempts)
+            passes = result.passed
+            error_message = result.error_message
 
             if not passes:
-                previous_implementation = implementation
-                error_guidance, docs = self.process_errors(error_message, implementation, docs)
-                self.switch_to_debug_agent_if_needed()
+                # stop spending attempts if we're going round in circles (unless a change of strategy might help)
+                stall = self.attempt_history.record(implementation, result.errors)
+                self.stalled = None
+                if not stall or self.change_strategy(stall):
+                    previous_implementation = implementation
+                    error_guidance, docs = self.process_errors(result, implementation, docs)
+                    self.switch_to_debug_agent_if_needed()
             else:
                 # Quality check
                 quality_check, cost = self.quality_agent.run(gitlab_yaml=self.gitlab_yaml, github_yaml=implementation)
-                self.total_cost += cost
+                self.add_cost(cost)
                 logger.debug(f"Quality check: {quality_check}")
                 quality_check_passed = self.quality_check_passed(quality_check)
                 if quality_check_passed:
@@ -239,29 +621,167 @@ class GitLabToGitHubConverter:
                         error_guidance = quality_check
                         self.switch_to_debug_agent_if_needed()
 
+            if self.router:
+                self.router.record_attempt(passes and (quality_check_passed or not self.thorough), self.total_cost - attempt_cost)
+                if self.router.model != self.implementation_model:
+                    self.use_implementation_model(self.router.model)
+
+            self.save_state("attempt", plan=plan, initial_implementation=None, attempts=attempts, passes=passes,
+                            quality_check_passed=quality_check_passed, implementation=implementation,
+                            previous_implementation=previous_implementation, error_message=error_message,
+                            error_guidance=error_guidance, quality_check=quality_check, docs=docs)
+
+        if passes and quality_check_passed and self.similarity_index:
+            self.similarity_index.add(self.gitlab_yaml, implementation, attempts)
+
+        return self.finish(implementation, attempts, passes, quality_check_passed, quality_check)
+
+    def find_similar_conversion(self) -> bool:
+        """
+        Look for a previous conversion of a nearly identical pipeline.  If there is one, its workflow is given to the
+        implementation agent as a reference - the pipeline is still planned and converted in its own right.
+        """
+        if not self.similarity_index:
+            return False
+        match = self.similarity_index.find(self.gitlab_yaml)
+        if not match or not match["workflow"]:
+            return False
+        logger.info(f"Pipeline is {match['similarity']:.0%} similar to an earlier conversion - using its workflow as a reference")
+        self.similar_conversion = {"key": match["key"], "similarity": match["similarity"]}
+        self.reference_workflow = match["workflow"]
+        return True
+
+    def save_state(self, stage: str, **state):
+        """Checkpoint the run after a stage, along with everything the converter itself needs to carry on"""
+        self.checkpoint.save(
+            stage,
+            self.source_yaml,
+            output_basename=self.output_basename,
+            pipeline_yaml=self.gitlab_yaml,
+            shared_workflows=[shared.to_dict() for shared in self.shared_workflows],
+            total_cost=self.total_cost,
+            output_results=self.output_results,
+            final_validation_errors=self.final_validation_errors,
+            used_fast_path=self.used_fast_path,
+            draft_workflow=self.draft_workflow,
+            draft_gaps=self.draft_gaps,
+            reference_workflow=self.reference_workflow,
+            similar_conversion=self.similar_conversion,
+            attempt_history=self.attempt_history.to_dict(),
+            stalled=self.stalled,
+            strategy_changes=self.strategy_changes,
+            variant_offset=self.variant_offset,
+            stopped_early=self.stopped_early,
+            debugging=isinstance(self.worker_agent, DebugAgent),
+            router=self.router.state() if self.router else None,
+            **state
+        )
+
+    def restore_state(self, state: dict):
+        """Put the converter back as it was when `state` was saved"""
+        self.total_cost = state["total_cost"]
+        self.gitlab_yaml = state["pipeline_yaml"]
+        self.shared_workflows = [SharedWorkflow(**shared) for shared in state["shared_workflows"]]
+        self.output_results = state["output_results"]
+        self.final_validation_errors = state["final_validation_errors"]
+        self.used_fast_path = state["used_fast_path"]
+        self.draft_workflow = state["draft_workflow"]
+        self.draft_gaps = state["draft_gaps"]
+        self.reference_workflow = state["reference_workflow"]
+        self.similar_conversion = state["similar_conversion"]
+        self.attempt_history = AttemptHistory.from_dict(state["attempt_history"])
+        self.stalled = state["stalled"]
+        self.strategy_changes = state["strategy_changes"]
+        self.variant_offset = state["variant_offset"]
+        self.stopped_early = state["stopped_early"]
+        if self.router and not (state["router"] and self.router.restore(state["router"])):
+            self.use_implementation_model(self.router.start(self.gitlab_yaml))
+        elif self.router:
+            self.use_implementation_model(self.router.model)
+        if state["debugging"]:
+            self.switch_to_debug_agent_if_needed()
+        logger.info(f"Carrying on after attempt {state.get('attempts', 0)} (US${self.total_cost} spent so far)")
+
+    def finish(self, implementation: str, attempts: int, passes: bool, quality_check_passed: bool, quality_check: str):
+        """Save the final output, report on the run and return the exit code"""
+        self.attempts = attempts
+        self.passed = passes
+        self.quality_check_result = quality_check_passed
+
         # Save final output
         self.save_implementation(implementation, attempts, is_final=True)
-        self.save_quality_check(quality_check)
+        if quality_check or not self.used_fast_path:
+            self.save_quality_check(quality_check)
 
         # Display results
         logger.info(f"Total cost: US${self.total_cost}")
+        if self.router:
+            for tier in self.router.stats():
+                logger.info(f"  Tier {tier['tier']} ({tier['model']}): {tier['attempts']} attempts, US${tier['cost']}")
+        for shared in self.shared_workflows:
+            logger.info(f"Reusable workflow for {shared.path} saved as {shared.filename} - commit it as .github/workflows/{shared.name}.yml")
+        retries = self.limiter.retries - self.starting_retries
+        if retries:
+            logger.info(f"Retried {retries} rate-limited or failed LLM calls")
+        if self.llm_cache:
+            logger.info(f"LLM cache: {self.llm_cache.stats()}")
+        if self.docs_agent.index_hits:
+            logger.info(f"Used the docs index for {self.docs_agent.index_hits} errors")
+        if self.docs_store:
+            logger.info(f"Docs store: {self.docs_store.stats()}")
+            self.docs_store.purge_expired()
+        self.tracer.write_report(f"{self.output_basename}_report.json", self.summary())
+        if self.otlp_exporter:
+            self.otlp_exporter.export(self.tracer, {"gl2gh.passed": passes, "gl2gh.attempts": attempts, "gl2gh.total_cost": self.total_cost})
         self.display_results()
 
         return 0 if passes else 1
 
 
 def main(gitlab_yaml: str, max_attempts: int = 3, debug_file: str | None = None,
-         provider: str = "openrouter", thinking_model: str = "openai/o4-mini", implementation_model: str = "openai/o4-mini", thorough: bool = False):
+         provider: str = "openrouter", thinking_model: str = "openai/o4-mini", implementation_model: str = "openai/o4-mini", thorough: bool = False,
+         output_dir: str = ".", cache_dir: str = ".gl2gh_cache", use_cache: bool = True,
+         docs_concurrency: int = 4, candidates: int = 1, patch_repair: bool = False,
+         decompose_jobs: int = 0, fast_path: bool = True, docs_token_budget: int = 1500, otlp_endpoint: str | None = None,
+         stream: bool = False, model_tiers: list[str] | None = None, escalate_after: int = 1,
+         requests_per_minute: float = 0, tokens_per_minute: float = 0, resume: str | None = None,
+         include_root: str | None = None, shared_workflows: bool = False, similarity_threshold: float = 0,
+         docs_index: str | None = DEFAULT_INDEX_PATH, offline_docs: bool = False):
     """Main entry point for the script"""
-    converter = GitLabToGitHubConverter(
-        gitlab_yaml=gitlab_yaml,
-        max_attempts=max_attempts,
-        debug_file=debug_file,
-        provider=provider,
-        thinking_model=thinking_model,
-        implementation_model=implementation_model,
-        thorough=thorough
-    )
+    try:
+        converter = GitLabToGitHubConverter(
+            gitlab_yaml=gitlab_yaml,
+            max_attempts=max_attempts,
+            debug_file=debug_file,
+            provider=provider,
+            thinking_model=thinking_model,
+            implementation_model=implementation_model,
+            thorough=thorough,
+            output_dir=output_dir,
+            cache_dir=cache_dir,
+            use_cache=use_cache,
+            docs_concurrency=docs_concurrency,
+            candidates=candidates,
+            patch_repair=patch_repair,
+            decompose_jobs=decompose_jobs,
+            fast_path=fast_path,
+            docs_token_budget=docs_token_budget,
+            otlp_endpoint=otlp_endpoint,
+            stream=stream,
+            model_tiers=model_tiers,
+            escalate_after=escalate_after,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            resume=resume,
+            include_root=include_root,
+            shared_workflows=shared_workflows,
+            similarity_threshold=similarity_threshold,
+            docs_index=docs_index,
+            offline_docs=offline_docs
+        )
+    except CheckpointError as e:
+        logger.error(str(e))
+        exit(1)
 
     exit_code = converter.run()
     exit(exit_code)
@@ -277,9 +797,30 @@ if __name__ == "__main__":
     parser.add_argument("--thinking-model", type=str, required=False, default=os.getenv("LLM_THINKING_MODEL", default_model), help="LLM model to use for thinking")
     parser.add_argument("--implementation-model", type=str, required=False, default=os.getenv("LLM_IMPLEMENTATION_MODEL", default_model), help="LLM model to use for implementation")
     parser.add_argument("--thorough", action="store_true", required=False, default=False, help="Regenerate the GitHub YAML if the quality check fails")
+    parser.add_argument("--output-dir", type=str, required=False, default=".", help="Directory to write the output files to")
+    parser.add_argument("--cache-dir", type=str, required=False, default=os.getenv("GL2GH_CACHE_DIR", ".gl2gh_cache"), help="Directory for the on-disk caches")
+    parser.add_argument("--no-cache", action="store_true", required=False, default=False, help="Don't read or write the on-disk caches (LLM responses and documentation)")
+    parser.add_argument("--docs-concurrency", type=int, required=False, default=4, help="Maximum number of documentation pages to fetch and summarise at once")
+    parser.add_argument("--docs-token-budget", type=int, required=False, default=1500, help="Approximate number of tokens of each documentation page to include when summarising it")
+    parser.add_argument("--candidates", type=int, required=False, default=1, help="Number of implementations to generate in parallel on each attempt (the best one is carried forward)")
+    parser.add_argument("--patch-repair", action="store_true", required=False, default=False, help="Fix failed attempts by asking for a patch against the previous workflow rather than a complete rewrite")
+    parser.add_argument("--decompose-jobs", type=int, required=False, default=0, help="Convert pipelines with more than this many jobs in parallel groups of this size (0 disables)")
+    parser.add_argument("--no-fast-path", action="store_true", required=False, default=False, help="Always use the LLM, even for pipelines simple enough for the rule-based translator")
+    parser.add_argument("--otlp-endpoint", type=str, required=False, default=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"), help="Send the run's timing spans to this OpenTelemetry collector (OTLP over HTTP, eg http://localhost:4318)")
+    parser.add_argument("--stream", action="store_true", required=False, default=False, help="Stream the generated workflows, abandoning and retrying ones which are clearly unusable part way through")
+    parser.add_argument("--model-tiers", type=str, nargs="+", required=False, default=os.getenv("LLM_MODEL_TIERS", "").split() or None, help="Implementation models to cascade through, cheapest first - the starting tier depends on the pipeline's complexity and failed attempts escalate to the next one (overrides --implementation-model)")
+    parser.add_argument("--escalate-after", type=int, required=False, default=1, help="Number of failed attempts on a model tier before escalating to the next")
+    parser.add_argument("--requests-per-minute", type=float, required=False, default=float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0)), help="Maximum LLM requests per minute to the provider (0 for no limit)")
+    parser.add_argument("--tokens-per-minute", type=float, required=False, default=float(os.getenv("LLM_TOKENS_PER_MINUTE", 0)), help="Maximum prompt tokens per minute to the provider (0 for no limit)")
+    parser.add_argument("--resume", type=str, required=False, help="Carry on an interrupted run from its last completed stage - the run's state file, or its output basename (eg output/output_20250101_120000)")
+    parser.add_argument("--include-root", type=str, required=False, help="Repository root that local `include:` files are read from (default: the directory containing --gitlab-yaml)")
+    parser.add_argument("--shared-workflows", action="store_true", required=False, default=False, help="Convert the jobs of locally included files into reusable workflows, once, and reuse them across pipelines")
+    parser.add_argument("--similarity-threshold", type=float, required=False, default=0, help="Give the implementation agent the workflow of a previously converted pipeline at least this similar (0-1, eg 0.85) as a reference (default: 0, disabled)")
+    parser.add_argument("--docs-index", type=str, required=False, default=DEFAULT_INDEX_PATH, help="Index of pre-written guidance for actionlint's errors, checked before fetching any documentation (an empty string disables it)")
+    parser.add_argument("--offline-docs", action="store_true", required=False, default=False, help="Never fetch documentation - only use the docs index and previously stored summaries")
     args = parser.parse_args()
 
     with open(args.gitlab_yaml, "r") as f:
         gitlab_contents = f.read()
 
-    main(gitlab_contents, args.max_attempts, args.debug_file, args.provider, args.thinking_model, args.implementation_model, args.thorough)
+    main(gitlab_contents, args.max_attempts, args.debug_file, args.provider, args.thinking_model, args.implementation_model, args.thorough, args.output_dir, args.cache_dir, not args.no_cache, args.docs_concurrency, args.candidates, args.patch_repair, args.decompose_jobs, not args.no_fast_path, args.docs_token_budget, args.otlp_endpoint, args.stream, args.model_tiers, args.escalate_after, args.requests_per_minute, args.tokens_per_minute, args.resume, args.include_root or os.path.dirname(os.path.abspath(args.gitlab_yaml)), args.shared_workflows, args.similarity_threshold, args.docs_index, args.offline_docs)
@@ -0,0 +1,318 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from agents.docs import make_session
+from agents.docs_index import DEFAULT_INDEX_PATH, DocsIndex
+from main import GitLabToGitHubConverter, setup_logging
+
+logger = logging.getLogger("gl2gh")
+
+# the most a submitted pipeline can be
+MAX_BODY_BYTES = 5 * 1024 * 1024
+
+
+class ConversionJob:
+    """
+    One submitted pipeline and what has happened to it - `queued`, `running`, then `passed`, `failed` or `error` (or
+    `cancelled`, if the service was stopped before it started)
+    """
+
+    def __init__(self, gitlab_yaml: str, output_dir: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.gitlab_yaml = gitlab_yaml
+        self.output_dir = os.path.join(output_dir, self.id)
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.summary = {}
+        self.error = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def workflow_filename(self) -> str | None:
+        if not self.summary.get("output_basename"):
+            return None
+        return f"{self.summary['output_basename']}_final.yml"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "submitted": datetime.fromtimestamp(self.submitted).isoformat(timespec="seconds"),
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds") if self.started else None,
+            "duration": round((self.finished or time.time()) - self.started, 2) if self.started else None,
+            "output_dir": self.output_dir,
+            "error": self.error,
+            "summary": self.summary,
+        }
+
+
+class ConversionService:
+    """
+    Converts submitted pipelines on a pool of `workers` threads, in the order they were submitted.
+
+    Everything which can outlive a single conversion is set up once and kept warm for the next one: the imports, the
+    compiled prompt templates (see `get_environment`), the docs index, the docs HTTP session and its open connections,
+    and the per-provider rate limiters - along with the on-disk LLM cache and docs store the converters share.  Each
+    conversion then only pays for its own model calls.  Finished jobs are kept (up to `keep_jobs` of them) so their
+    status and results can be fetched.
+    """
+
+    def __init__(self, output_dir: str = "server_output", workers: int = 2, keep_jobs: int = 1000, **options):
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+        self.keep_jobs = keep_jobs
+        docs_index = options.pop("docs_index", DEFAULT_INDEX_PATH)
+        self.options = {
+            **options,
+            "docs_index": DocsIndex.load(docs_index) if docs_index else None,
+            "docs_session": make_session(options.get("docs_concurrency", 4) * self.workers),
+        }
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.threads = []
+        os.makedirs(output_dir, exist_ok=True)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"gl2gh-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Started {self.workers} conversion workers")
+
+    def stop(self):
+        """Let the running conversions finish - queued ones are cancelled"""
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.status = "cancelled"
+                job.finished = time.time()
+                logger.info(f"Cancelled queued job {job.id}")
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def submit(self, gitlab_yaml: str) -> ConversionJob:
+        job = ConversionJob(gitlab_yaml, self.output_dir)
+        with self.jobs_lock:
+            self.jobs[job.id] = job
+            self.prune()
+        self.queue.put(job)
+        logger.info(f"Queued job {job.id} ({self.queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id: str) -> ConversionJob | None:
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> list[ConversionJob]:
+        with self.jobs_lock:
+            return sorted(self.jobs.values(), key=lambda job: job.submitted)
+
+    def prune(self):
+        """Forget the oldest finished jobs once there are more than `keep_jobs` (their output files are left alone)"""
+        finished = sorted((job for job in self.jobs.values() if job.done), key=lambda job: job.finished)
+        for job in finished[:max(0, len(self.jobs) - self.keep_jobs)]:
+            del self.jobs[job.id]
+
+    def stats(self) -> dict:
+        counts = {}
+        for job in self.list_jobs():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "waiting": self.queue.qsize(), "jobs": counts}
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            self.run_job(job)
+
+    def run_job(self, job: ConversionJob):
+        """Convert one job's pipeline (never raises, so one bad pipeline doesn't stop a worker)"""
+        job.status = "running"
+        job.started = time.time()
+        logger.info(f"Starting job {job.id}")
+        try:
+            converter = GitLabToGitHubConverter(gitlab_yaml=job.gitlab_yaml, output_dir=job.output_dir, **self.options)
+            converter.run()
+            job.summary = converter.summary()
+            job.status = "passed" if job.summary["passed"] else "failed"
+        except Exception as e:
+            logger.error(f"Error converting job {job.id}: {e}")
+            job.error = str(e)
+            job.status = "error"
+        job.finished = time.time()
+        logger.info(f"Finished job {job.id} ({job.status}, US${job.summary.get('total_cost', 0)})")
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP API:
+
+      POST /jobs                  submit a pipeline - the body is the GitLab YAML (or JSON with a `gitlab_yaml` key)
+      GET  /jobs                  every job's status
+      GET  /jobs/<id>             a job's status and, once it has finished, its summary
+      GET  /jobs/<id>/workflow    the converted workflow, once the job has finished
+      GET  /health                the number of workers and jobs
+    """
+
+    service: ConversionService = None
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("?", 1)[0].split("/") if part]
+        if parts == ["health"]:
+            return self.send_json(200, {"status": "ok", **self.service.stats()})
+        if parts == ["jobs"]:
+            return self.send_json(200, {"jobs": [job.to_dict() for job in self.service.list_jobs()]})
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None:
+                return self.send_json(404, {"error": f"No such job: {parts[1]}"})
+            if len(parts) == 2:
+                return self.send_json(200, job.to_dict())
+            if parts[2] == "workflow":
+                return self.send_workflow(job)
+        self.send_json(404, {"error": f"Not found: {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self.send_json(404, {"error": f"Not found: {self.path}"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return self.send_json(400, {"error": "The request body should be the GitLab YAML to convert"})
+        if length > MAX_BODY_BYTES:
+            return self.send_json(413, {"error": f"The pipeline is larger than {MAX_BODY_BYTES} bytes"})
+        body = self.rfile.read(length).decode("utf-8", errors="replace")
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                body = json.loads(body)["gitlab_yaml"]
+            except (ValueError, KeyError, TypeError):
+                return self.send_json(400, {"error": "JSON requests need a `gitlab_yaml` string"})
+        job = self.service.submit(body)
+        self.send_json(202, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+
+    def send_workflow(self, job: ConversionJob):
+        if not job.done:
+            return self.send_json(409, {"error": f"Job {job.id} is still {job.status}"})
+        filename = job.workflow_filename
+        if not filename or not os.path.exists(filename):
+            return self.send_json(404, {"error": f"Job {job.id} has no workflow", "status": job.status})
+        with open(filename, "rb") as f:
+            content = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/yaml")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_json(self, status: int, payload: dict, headers: dict | None = None):
+        content = json.dumps(payload, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, output_dir: str = "server_output", workers: int = 2,
+          keep_jobs: int = 1000, **options):
+    """Run the conversion service until interrupted"""
+    service = ConversionService(output_dir, workers, keep_jobs, **options)
+    service.start()
+    handler = type("Handler", (ConversionRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    logger.info(f"Listening on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down - waiting for running conversions to finish")
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    default_model = "o4-mini"
+    parser = argparse.ArgumentParser(description="Run a local HTTP service which converts submitted GitLab pipelines")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--output-dir", type=str, default="server_output", help="Directory for each job's output directory")
+    parser.add_argument("--workers", type=int, default=2, help="Number of pipelines to convert concurrently")
+    parser.add_argument("--keep-jobs", type=int, default=1000, help="Number of finished jobs to remember the status of")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Maximum number of attempts to make per pipeline")
+    parser.add_argument("--debug-file", type=str, required=False, help="Path to a file for detailed debug logging")
+    parser.add_argument("--provider", type=str, required=False, default=os.getenv("LLM_PROVIDER", "openai"), help="LLM provider to use")
+    parser.add_argument("--thinking-model", type=str, required=False, default=os.getenv("LLM_THINKING_MODEL", default_model), help="LLM model to use for thinking")
+    parser.add_argument("--implementation-model", type=str, required=False, default=os.getenv("LLM_IMPLEMENTATION_MODEL", default_model), help="LLM model to use for implementation")
+    parser.add_argument("--thorough", action="store_true", required=False, default=False, help="Regenerate the GitHub YAML if the quality check fails")
+    parser.add_argument("--cache-dir", type=str, required=False, default=os.getenv("GL2GH_CACHE_DIR", ".gl2gh_cache"), help="Directory for the on-disk caches")
+    parser.add_argument("--no-cache", action="store_true", required=False, default=False, help="Don't read or write the on-disk caches (LLM responses and documentation)")
+    parser.add_argument("--docs-concurrency", type=int, required=False, default=4, help="Maximum number of documentation pages to fetch and summarise at once")
+    parser.add_argument("--docs-token-budget", type=int, required=False, default=1500, help="Approximate number of tokens of each documentation page to include when summarising it")
+    parser.add_argument("--candidates", type=int, required=False, default=1, help="Number of implementations to generate in parallel on each attempt (the best one is carried forward)")
+    parser.add_argument("--patch-repair", action="store_true", required=False, default=False, help="Fix failed attempts by asking for a patch against the previous workflow rather than a complete rewrite")
+    parser.add_argument("--decompose-jobs", type=int, required=False, default=0, help="Convert pipelines with more than this many jobs in parallel groups of this size (0 disables)")
+    parser.add_argument("--no-fast-path", action="store_true", required=False, default=False, help="Always use the LLM, even for pipelines simple enough for the rule-based translator")
+    parser.add_argument("--otlp-endpoint", type=str, required=False, default=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"), help="Send each run's timing spans to this OpenTelemetry collector (OTLP over HTTP, eg http://localhost:4318)")
+    parser.add_argument("--stream", action="store_true", required=False, default=False, help="Stream the generated workflows, abandoning and retrying ones which are clearly unusable part way through")
+    parser.add_argument("--model-tiers", type=str, nargs="+", required=False, default=os.getenv("LLM_MODEL_TIERS", "").split() or None, help="Implementation models to cascade through, cheapest first - the starting tier depends on the pipeline's complexity and failed attempts escalate to the next one (overrides --implementation-model)")
+    parser.add_argument("--escalate-after", type=int, required=False, default=1, help="Number of failed attempts on a model tier before escalating to the next")
+    parser.add_argument("--requests-per-minute", type=float, required=False, default=float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0)), help="Maximum LLM requests per minute to the provider, shared by all the workers (0 for no limit)")
+    parser.add_argument("--tokens-per-minute", type=float, required=False, default=float(os.getenv("LLM_TOKENS_PER_MINUTE", 0)), help="Maximum prompt tokens per minute to the provider, shared by all the workers (0 for no limit)")
+    parser.add_argument("--similarity-threshold", type=float, required=False, default=0, help="Give the implementation agent the workflow of a previously converted pipeline at least this similar (0-1, eg 0.85) as a reference (default: 0, disabled)")
+    parser.add_argument("--docs-index", type=str, required=False, default=DEFAULT_INDEX_PATH, help="Index of pre-written guidance for actionlint's errors, checked before fetching any documentation (an empty string disables it)")
+    parser.add_argument("--offline-docs", action="store_true", required=False, default=False, help="Never fetch documentation - only use the docs index and previously stored summaries")
+    args = parser.parse_args()
+
+    setup_logging(args.debug_file)
+    serve(
+        args.host,
+        args.port,
+        args.output_dir,
+        args.workers,
+        args.keep_jobs,
+        max_attempts=args.max_attempts,
+        provider=args.provider,
+        thinking_model=args.thinking_model,
+        implementation_model=args.implementation_model,
+        thorough=args.thorough,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        docs_concurrency=args.docs_concurrency,
+        docs_token_budget=args.docs_token_budget,
+        otlp_endpoint=args.otlp_endpoint,
+        candidates=args.candidates,
+        patch_repair=args.patch_repair,
+        decompose_jobs=args.decompose_jobs,
+        fast_path=not args.no_fast_path,
+        stream=args.stream,
+        model_tiers=args.model_tiers,
+        escalate_after=args.escalate_after,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        similarity_threshold=args.similarity_threshold,
+        docs_index=args.docs_index,
+        offline_docs=args.offline_docs,
+    )